@@ -1,4 +1,4 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Response
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from supabase import create_client, Client
@@ -37,15 +37,26 @@ app.add_middleware(
 )
 
 @app.get("/api/get_plotinfo_from_hash")
-def get_plotinfo_from_hash(hash: str):
+def get_plotinfo_from_hash(hash: str, response: Response, lod: int = Query(0, ge=0)):
+    """
+    lod > 0 returns the downsampled plot data from dos_bands_lod, or the full
+    data if that level was not computed. X-LOD reports the level served.
+    """
     if not hash:
         return {"message": "No hash provided"}
 
     try:
         supabase = get_supabase_client()
-        response = supabase.table("dos_bands").select("*").eq("hash", hash).limit(1).execute()
+        if lod > 0:
+            downsampled = supabase.table("dos_bands_lod").select("plotinfo").eq("hash", hash).eq("lod", lod).limit(1).execute()
+            if downsampled.data:
+                response.headers["X-LOD"] = str(lod)
+                return downsampled.data[0]["plotinfo"]
 
-        return response.data[0]
+        result = supabase.table("dos_bands").select("*").eq("hash", hash).limit(1).execute()
+
+        response.headers["X-LOD"] = "0"
+        return result.data[0]
     
     except Exception as e:
         print(f"Supabase error: {e}")
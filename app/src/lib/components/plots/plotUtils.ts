@@ -1,12 +1,15 @@
 import { baseApi } from "$lib/api";
 
-export async function fetchBandData(item) {
+// lod > 0 asks for downsampled data (3 is sized for card previews). The level
+// actually served comes back in X-LOD: 0 (full data) when the level was not
+// computed, or when the backend does not send the header at all
+export async function fetchBandData(item, lod = 0) {
     const res = await fetch(
-        `${baseApi}/get_plotinfo_from_hash?hash=${item.hash}`,
+        `${baseApi}/get_plotinfo_from_hash?hash=${item.hash}&lod=${lod}`,
     );
     let data = await res.json()
 
-    return data
+    return { data, lod: Number(res.headers.get("X-LOD") ?? 0) }
 }
 
 const baseBandsLayout = {
@@ -0,0 +1,58 @@
+# Micro-benchmark: pydantic (class_row + response model) vs the fast=true path
+# (dict rows + orjson) for get_all and get_plotinfo_from_hash. Runs the app
+# in-process against the database configured in .env; the plot cache is cleared
+# before every call so each one reaches Postgres.
+#
+# usage: python ./developer_api/bench_serialization.py [--hash HASH] [--repeat N]
+
+import argparse
+import os
+import sys
+import time
+from fastapi.testclient import TestClient
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from main import app
+from routers.v2_api import plot_cache
+
+def best_of(client: TestClient, path: str, repeat: int) -> tuple:
+    """Fastest wall time of repeat requests in milliseconds, and the body size."""
+    times = []
+    for _ in range(repeat):
+        plot_cache.clear()
+        start = time.perf_counter()
+        response = client.get(path)
+        times.append(time.perf_counter() - start)
+        response.raise_for_status()
+    return min(times) * 1e3, len(response.content)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare pydantic and fast=true serialization.")
+    parser.add_argument("--hash", help="dos_bands hash to fetch (default: the first with a band structure)")
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with TestClient(app) as client:
+        hash = args.hash
+        if hash is None:
+            rows = client.get("/api/materials", params={"fields": "hash", "limit": 500}).json()["items"]
+            hash = next(
+                r["hash"] for r in rows
+                if (client.get("/api/get_plotinfo_from_hash", params={"hash": r["hash"], "datasets": "bands"}).json() or {}).get("bands")
+            )
+
+        paths = [
+            "/api/get_all",
+            "/api/get_all?connectivity=dense",
+            f"/api/get_plotinfo_from_hash?hash={hash}",
+        ]
+        print(f"{'endpoint':<50} {'KB':>8} {'pydantic ms':>12} {'fast ms':>9} {'speedup':>8}")
+        for path in paths:
+            separator = "&" if "?" in path else "?"
+            slow_ms, size = best_of(client, path, args.repeat)
+            fast_ms, _ = best_of(client, f"{path}{separator}fast=true", args.repeat)
+            print(f"{path[:50]:<50} {size / 1024:>8.0f} {slow_ms:>12.1f} {fast_ms:>9.1f} {slow_ms / fast_ms:>7.1f}x")
+
+if __name__ == "__main__":
+    main()
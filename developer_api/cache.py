@@ -0,0 +1,82 @@
+# In-process cache of serialized responses, bounded by total body size, with
+# LRU eviction and a TTL. Used for the hash-addressed plot data, which never
+# changes for a given hash.
+
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    headers: Dict[str, str]
+    etag: str  # strong, derived from the body
+    expires: float
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        entry = self.entries.get(key)
+        if entry is not None and entry.expires <= time.monotonic():
+            self.remove(key)
+            self.evictions += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def entry(self, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        """An entry as put() would store it, for responses served without caching."""
+        return CachedResponse(
+            body=body,
+            media_type=media_type,
+            headers=headers or {},
+            etag='"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"',
+            expires=time.monotonic() + self.ttl,
+        )
+
+    def put(self, key: Hashable, body: bytes, media_type: str, headers: Optional[Dict[str, str]] = None) -> CachedResponse:
+        entry = self.entry(body, media_type, headers)
+        if len(body) > self.max_bytes:
+            return entry  # would evict everything else, serve it uncached
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = entry
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
+            self.evictions += 1
+        return entry
+
+    def remove(self, key: Hashable) -> None:
+        entry = self.entries.pop(key)
+        self.size -= len(entry.body)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self.entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
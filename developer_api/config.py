@@ -11,6 +11,39 @@ class Settings(BaseSettings):
     db_port: str
     db_name: str
 
+    # connection pool (see psycopg_pool.AsyncConnectionPool); a request that
+    # cannot get a connection within pool_timeout seconds, or finds
+    # pool_max_waiting requests already queued, gets a 503 with Retry-After
+    pool_min_size: int = 4
+    pool_max_size: int = 16
+    pool_timeout: float = 5
+    pool_max_waiting: int = 64
+    pool_max_idle: float = 600
+    pool_max_lifetime: float = 3600
+    pool_retry_after: int = 1
+    # seconds between pool.check() health checks of idle connections, 0 to disable
+    pool_check_interval: float = 600
+
+    # serialized get_plotinfo_from_hash responses kept in memory
+    plot_cache_max_bytes: int = 256 * 1024 * 1024
+    plot_cache_ttl: float = 24 * 3600
+
+    # largest page /materials will return
+    max_page_size: int = 500
+
+    # requests taking longer than this many seconds are logged with their SQL (timing.py)
+    slow_request_threshold: float = 1.0
+
+    # X-Admin-Token value that enables X-Profile: 1 and /admin/profiles (profiling.py); unset disables both
+    admin_token: str = ""
+    profile_dir: str = "profiles"
+
+    # seconds between checks for data changes that rebuild the typeahead index
+    typeahead_refresh_interval: float = 60
+
+    # seconds /facets serves its counts from memory before re-reading material_facets
+    facet_cache_ttl: float = 60
+
     class Config:
         env_file = ".env"
 
@@ -2,6 +2,7 @@ from functools import lru_cache
 from typing import Any
 from psycopg_pool import AsyncConnectionPool
 from config import Settings, get_settings
+from timing import TimedConnectionPool, configure_connection
 
 settings: Settings = get_settings()
 
@@ -9,4 +10,15 @@ conninfo = f"user={settings.db_user} password={settings.db_password} host={setti
 
 @lru_cache()
 def get_async_pool() -> AsyncConnectionPool:
-    return AsyncConnectionPool(conninfo=conninfo)
+    # opened in the app lifespan; the Timed* classes feed the per-request timings (timing.py)
+    return TimedConnectionPool(
+        conninfo=conninfo,
+        configure=configure_connection,
+        min_size=settings.pool_min_size,
+        max_size=settings.pool_max_size,
+        timeout=settings.pool_timeout,
+        max_waiting=settings.pool_max_waiting,
+        max_idle=settings.pool_max_idle,
+        max_lifetime=settings.pool_max_lifetime,
+        open=False,
+    )
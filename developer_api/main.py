@@ -1,37 +1,109 @@
 import asyncio
 from contextlib import asynccontextmanager
 from typing import Any
-from fastapi import FastAPI
-from psycopg_pool import AsyncConnectionPool
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from psycopg_pool import AsyncConnectionPool, PoolTimeout, TooManyRequests
 from fastapi.middleware.cors import CORSMiddleware
 
+from config import get_settings
 from db import get_async_pool
+from metrics import render_cache_stats, render_metrics, render_pool_stats, request_metrics
+from profiling import is_admin, read_report, request_gate, save_profile, start_profiler, stop_profiler
 from routers import v2_api
+from timing import RequestTiming, current_timing, log_slow_request, server_timing
+from typeahead import typeahead_index
 
 pool: AsyncConnectionPool[Any] | None = None  # Will be initialized during lifespan
 
 async def check_connections() -> None:
     while True:
-        await asyncio.sleep(600)  # wait 10 minutes
-        print("Checking Connections")
+        await asyncio.sleep(get_settings().pool_check_interval)
         if pool:
             await pool.check()
 
 
+async def rebuild_typeahead() -> None:
+    # a failure (e.g. the database is not up yet) leaves the index as it was until the next try
+    try:
+        if pool and await typeahead_index.refresh(pool):
+            print("Rebuilt typeahead index")
+    except Exception as e:
+        print(f"Typeahead refresh failed: {e}")
+
+
+async def refresh_typeahead() -> None:
+    while True:
+        await asyncio.sleep(get_settings().typeahead_refresh_interval)
+        await rebuild_typeahead()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     global pool
     pool = get_async_pool()
     await pool.open()
-    task = asyncio.create_task(check_connections())
+    await rebuild_typeahead()
+    task = asyncio.create_task(check_connections()) if get_settings().pool_check_interval > 0 else None
+    typeahead_task = asyncio.create_task(refresh_typeahead())
     yield None
-    task.cancel()
-    await pool.check()
+    if task:
+        task.cancel()
+    typeahead_task.cancel()
+    await pool.close()
 
 
 app = FastAPI(lifespan=lifespan)
 app.include_router(v2_api.router, prefix="/api")  # include the methods declared in our api
 
+
+@app.middleware("http")
+async def instrument_request(request: Request, call_next):
+    timing = RequestTiming()
+    profiler = None
+    profiling = bool(request.headers.get("x-profile")) and is_admin(
+        request.headers.get("x-admin-token"), get_settings().admin_token
+    )
+    # a profiled request runs alone, see profiling.py
+    async with request_gate.alone() if profiling else request_gate.shared():
+        if profiling:
+            profiler = start_profiler()
+            timing.statements = []
+        token = current_timing.set(timing)
+        try:
+            response = await call_next(request)
+        finally:
+            current_timing.reset(token)
+            if profiler is not None:
+                stop_profiler(profiler)
+    breakdown = timing.finish()
+    # the matched route's template, so /api/{id} is one series however many ids are requested
+    route = request.scope.get("route")
+    route_path = route.path if route is not None else "unmatched"
+    request_metrics.observe(request.method, route_path, response.status_code, breakdown["total"] / 1e3)
+    if breakdown["total"] >= get_settings().slow_request_threshold * 1e3:
+        log_slow_request(request.method, route_path, response.status_code, timing, breakdown)
+    if request.headers.get("x-debug-timing"):
+        response.headers["Server-Timing"] = server_timing(breakdown)
+    if profiler is not None and pool is not None:
+        profile_id = await save_profile(
+            profiler, timing.statements, pool, request.method, str(request.url.path), get_settings().profile_dir
+        )
+        if profile_id is not None:
+            response.headers["X-Profile-Id"] = profile_id
+    return response
+
+
+@app.exception_handler(PoolTimeout)
+@app.exception_handler(TooManyRequests)
+async def pool_saturated(request: Request, exc: Exception) -> JSONResponse:
+    # shed load instead of queueing without bound; the client retries shortly
+    return JSONResponse(
+        {"detail": "Server busy, try again shortly"},
+        status_code=503,
+        headers={"Retry-After": str(get_settings().pool_retry_after)},
+    )
+
 origins = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",
@@ -44,12 +116,41 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Or ["GET", "POST", ...]
     allow_headers=["*"],  # Or restrict to specific headers
+    expose_headers=["X-LOD"],  # read by the plots to tell a downsampled response from the full data
 )
 
 for route in app.routes:
     print(f"Path: {route.path} Methods: {route.methods}")
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Request counts and latency per route, pool stats and cache stats, in Prometheus text format."""
+    return PlainTextResponse(
+        render_metrics([
+            request_metrics.render(),
+            render_pool_stats(pool.get_stats() if pool else {}),
+            render_cache_stats({"plot": v2_api.plot_cache.stats(), "facets": v2_api.facet_cache.stats()}),
+        ]),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@app.get("/admin/profiles/{profile_id}", response_class=PlainTextResponse)
+async def profile(profile_id: str, request: Request) -> PlainTextResponse:
+    """
+    Text report of a request profiled with X-Profile: 1 (the .prof next to it
+    holds the full call tree). The profiled request ran with other requests held
+    back, since cProfile covers the whole event loop; background tasks may still appear.
+    """
+    if not is_admin(request.headers.get("x-admin-token"), get_settings().admin_token):
+        raise HTTPException(403)
+    report = read_report(profile_id, get_settings().profile_dir)
+    if report is None:
+        raise HTTPException(404)
+    return PlainTextResponse(report)
+
+
 @app.get("/")
 async def root():
     return {"message": "Hello World"}
@@ -0,0 +1,105 @@
+# Request and connection pool metrics in the Prometheus text exposition format,
+# served by /metrics. Kept in process (one set per worker) without a client
+# library: per-route request counters and latency histograms, plus the pool's
+# own get_stats() counters and the response cache stats.
+
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Mapping, Tuple
+
+# upper bounds in seconds of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# pool.get_stats() keys that are current values rather than running totals
+POOL_GAUGES = {"pool_min", "pool_max", "pool_size", "pool_available", "requests_waiting"}
+
+
+def escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def labels(**values: str) -> str:
+    return "{" + ",".join(f'{name}="{escape_label(str(value))}"' for name, value in values.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.counts = [0] * (len(buckets) + 1)  # the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, buckets: Tuple[float, ...], value: float) -> None:
+        self.counts[bisect_left(buckets, value)] += 1  # buckets are "less than or equal"
+        self.sum += value
+
+
+class RequestMetrics:
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        self.buckets = buckets
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.latency: Dict[Tuple[str, str], Histogram] = {}
+        self.lock = threading.Lock()  # sync endpoints run in the threadpool
+
+    def observe(self, method: str, route: str, status: int, seconds: float) -> None:
+        """Record one request; route is the path template ("/api/{id}"), not the URL, to bound the label set."""
+        with self.lock:
+            key = (method, route, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            histogram = self.latency.get((method, route))
+            if histogram is None:
+                histogram = self.latency[(method, route)] = Histogram(self.buckets)
+            histogram.observe(self.buckets, seconds)
+
+    def render(self) -> List[str]:
+        lines = [
+            "# HELP http_requests_total Requests handled, by route and status.",
+            "# TYPE http_requests_total counter",
+        ]
+        with self.lock:
+            for (method, route, status), count in sorted(self.requests.items()):
+                lines.append(f"http_requests_total{labels(method=method, route=route, status=str(status))} {count}")
+            lines += [
+                "# HELP http_request_duration_seconds Request latency, by route.",
+                "# TYPE http_request_duration_seconds histogram",
+            ]
+            for (method, route), histogram in sorted(self.latency.items()):
+                cumulative = 0
+                for bound, count in zip([*map(str, self.buckets), "+Inf"], histogram.counts):
+                    cumulative += count
+                    lines.append(
+                        f"http_request_duration_seconds_bucket{labels(method=method, route=route, le=bound)} {cumulative}"
+                    )
+                lines.append(f"http_request_duration_seconds_sum{labels(method=method, route=route)} {histogram.sum}")
+                lines.append(f"http_request_duration_seconds_count{labels(method=method, route=route)} {cumulative}")
+        return lines
+
+
+def render_pool_stats(stats: Mapping[str, int]) -> List[str]:
+    """pool.get_stats() as psycopg_pool_* metrics, plus the derived connections in use."""
+    stats = dict(stats)
+    stats.setdefault("requests_waiting", 0)
+    if "pool_size" in stats and "pool_available" in stats:
+        stats["connections_in_use"] = stats["pool_size"] - stats["pool_available"]
+    lines = []
+    for key, value in sorted(stats.items()):
+        kind = "gauge" if key in POOL_GAUGES or key == "connections_in_use" else "counter"
+        name = f"psycopg_pool_{key}" + ("_total" if kind == "counter" else "")
+        lines += [f"# TYPE {name} {kind}", f"{name} {value}"]
+    return lines
+
+
+def render_cache_stats(caches: Mapping[str, Mapping[str, int]]) -> List[str]:
+    """ResponseCache.stats() of each named cache as response_cache_* metrics."""
+    lines = []
+    for key in ("entries", "bytes", "max_bytes", "hits", "misses", "evictions"):
+        kind = "counter" if key in ("hits", "misses", "evictions") else "gauge"
+        name = f"response_cache_{key}" + ("_total" if kind == "counter" else "")
+        lines.append(f"# TYPE {name} {kind}")
+        lines += [f"{name}{labels(cache=cache)} {stats[key]}" for cache, stats in caches.items()]
+    return lines
+
+
+def render_metrics(sections: Iterable[List[str]]) -> str:
+    return "\n".join(line for section in sections for line in section) + "\n"
+
+
+request_metrics = RequestMetrics()
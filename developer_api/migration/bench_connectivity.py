@@ -0,0 +1,100 @@
+# Micro-benchmark: per-pair NeighborList loop (v4/v5 populate scripts) vs the
+# vectorized neighbor_list path in connectivity.py.
+#
+# usage: python ./developer_api/migration/bench_connectivity.py [files...] [--repeat N]
+
+import argparse
+import glob
+import json
+import os
+import time
+import numpy as np
+from ase.data import covalent_radii
+from ase.neighborlist import NeighborList
+
+from connectivity import bonds_to_matrix, build_supercell, supercell_bonds
+
+DEFAULT_FILES = [
+    os.path.join(os.path.dirname(__file__), "..", "json", "bulk", "Bi12S9Te9-mp-1227434.json"),
+]
+
+def legacy_connectivity(symbols, positions, cell) -> np.ndarray:
+    """The connectivity block as it was in v5_populate_database_from_json.py."""
+    supercell_atoms = build_supercell(symbols, positions, cell)
+
+    cutoffs = [
+        covalent_radii[supercell_atoms.get_atomic_numbers()[i]] * 1.3
+        for i in range(len(supercell_atoms))
+    ]
+    nl = NeighborList(cutoffs, self_interaction=False, bothways=True)
+    nl.update(supercell_atoms)
+
+    n_sites = len(supercell_atoms)
+    bond_matrix = np.zeros((n_sites, n_sites), dtype=int)
+
+    radii = covalent_radii
+    for i in range(n_sites):
+        indices, offsets = nl.get_neighbors(i)
+        for j, offset in zip(indices, offsets):
+            if np.all(offset == 0) and j > i:
+                distance = supercell_atoms.get_distance(i, j, mic=True)
+                threshold = 1.25 * (
+                    radii[supercell_atoms.numbers[i]] +
+                    radii[supercell_atoms.numbers[j]]
+                )
+                if distance <= threshold:
+                    bond_matrix[i, j] = 1
+                    bond_matrix[j, i] = 1
+    return bond_matrix
+
+def vectorized_connectivity(symbols, positions, cell) -> np.ndarray:
+    return bonds_to_matrix(*supercell_bonds(symbols, positions, cell))
+
+def best_of(fn, args, repeat: int) -> float:
+    """Fastest wall time of repeat calls, in milliseconds."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(*args)
+        times.append(time.perf_counter() - start)
+    return min(times) * 1e3
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare legacy and vectorized connectivity.")
+    parser.add_argument("files", nargs="*", help="material JSON files (globs allowed)")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    files = [f for pattern in (args.files or DEFAULT_FILES) for f in sorted(glob.glob(pattern, recursive=True))]
+    print(f"{'material':<40} {'sites':>6} {'legacy ms':>10} {'vector ms':>10} {'speedup':>8}  same")
+    skipped = []
+    for path in files:
+        name = os.path.basename(path).removesuffix(".json")
+        with open(path) as f:
+            raw = json.load(f)
+        # a few entries (e.g. some mono/mis files) have "symbols": {} and no sites to bond
+        if not all(raw.get(k) for k in ["symbols", "positions", "cell"]):
+            skipped.append((name, "no sites"))
+            continue
+        fn_args = (raw["symbols"], raw["positions"], raw["cell"]["array"])
+
+        try:
+            legacy = legacy_connectivity(*fn_args)
+            vectorized = vectorized_connectivity(*fn_args)
+        except Exception as e:
+            skipped.append((name, str(e)))
+            continue
+        legacy_ms = best_of(legacy_connectivity, fn_args, args.repeat)
+        vector_ms = best_of(vectorized_connectivity, fn_args, args.repeat)
+
+        print(
+            f"{name:<40} {len(legacy):>6} {legacy_ms:>10.2f} {vector_ms:>10.2f} "
+            f"{legacy_ms / vector_ms:>7.1f}x  {np.array_equal(legacy, vectorized)}"
+        )
+    if skipped:
+        print(f"skipped {len(skipped)} of {len(files)} files:")
+        for name, reason in skipped:
+            print(f"  {name}: {reason}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+# Chemical formula parsing: element -> count maps, reduced formulas and element
+# fractions. Used by the populate scripts and by the API's composition queries
+# (which import it as migration.composition, so it must not depend on ASE).
+
+import re
+from fractions import Fraction
+from math import gcd
+from typing import Dict, Union
+
+Count = Union[int, float]
+
+ELEMENTS = (
+    "H He Li Be B C N O F Ne Na Mg Al Si P S Cl Ar K Ca Sc Ti V Cr Mn Fe Co Ni Cu Zn Ga Ge As Se Br Kr "
+    "Rb Sr Y Zr Nb Mo Tc Ru Rh Pd Ag Cd In Sn Sb Te I Xe Cs Ba La Ce Pr Nd Pm Sm Eu Gd Tb Dy Ho Er Tm Yb "
+    "Lu Hf Ta W Re Os Ir Pt Au Hg Tl Pb Bi Po At Rn Fr Ra Ac Th Pa U Np Pu Am Cm Bk Cf Es Fm Md No Lr "
+    "Rf Db Sg Bh Hs Mt Ds Rg Cn Nh Fl Mc Lv Ts Og"
+).split()
+KNOWN_ELEMENTS = frozenset(ELEMENTS)
+
+TOKEN = re.compile(r"([A-Z][a-z]?)|([(\[])|([)\]])|(\d+(?:\.\d+)?)|(\s+)")
+
+def parse_formula(formula: str) -> Dict[str, Count]:
+    """
+    Element -> count, in order of first appearance. Handles counts with
+    decimals and nested groups: "Bi2Te3" -> {Bi: 2, Te: 3},
+    "Ge(SbTe2)2" -> {Ge: 1, Sb: 2, Te: 4}. Raises ValueError otherwise.
+    """
+    stack: list = [{}]
+    last = None  # what a following count multiplies: an element name or a closed group
+    pos = 0
+    while pos < len(formula):
+        match = TOKEN.match(formula, pos)
+        if match is None:
+            raise ValueError(f"Unexpected {formula[pos]!r} in formula {formula!r}")
+        pos = match.end()
+        element, opening, closing, number, _ = match.groups()
+        if element:
+            if element not in KNOWN_ELEMENTS:
+                raise ValueError(f"Unknown element {element!r} in formula {formula!r}")
+            stack[-1][element] = stack[-1].get(element, 0) + 1
+            last = element
+        elif opening:
+            stack.append({})
+            last = None
+        elif closing:
+            if len(stack) == 1:
+                raise ValueError(f"Unbalanced {closing!r} in formula {formula!r}")
+            last = stack.pop()
+            for e, count in last.items():
+                stack[-1][e] = stack[-1].get(e, 0) + count
+        elif number:
+            if last is None:
+                raise ValueError(f"Count {number} without an element in formula {formula!r}")
+            n = int(number) if number.isdigit() else float(number)
+            group = {last: 1} if isinstance(last, str) else last
+            for e, count in group.items():
+                stack[-1][e] += count * (n - 1)
+            last = None
+    if len(stack) != 1:
+        raise ValueError(f"Unclosed group in formula {formula!r}")
+    if not stack[0]:
+        raise ValueError(f"No elements in formula {formula!r}")
+    return stack[0]
+
+def format_count(count: Union[Count, Fraction]) -> str:
+    if count == 1:
+        return ""
+    if count == int(count):
+        return str(int(count))
+    return str(float(count))
+
+def reduced_formula(counts: Dict[str, Count]) -> str:
+    """Formula with counts divided by their greatest common divisor: {Ge: 6, Te: 2} -> "Ge3Te"."""
+    exact = {e: Fraction(str(c)) for e, c in counts.items()}
+    divisor = Fraction(0)
+    for count in exact.values():
+        # gcd of rationals, so "Bi0.5Sb1.5Te3" reduces like the migration's numeric gcd
+        divisor = Fraction(
+            gcd(count.numerator * divisor.denominator, divisor.numerator * count.denominator),
+            count.denominator * divisor.denominator,
+        )
+    return "".join(f"{e}{format_count(c / divisor)}" for e, c in exact.items())
+
+def element_fractions(counts: Dict[str, Count]) -> Dict[str, float]:
+    total = sum(counts.values())
+    return {e: c / total for e, c in counts.items()}
@@ -0,0 +1,60 @@
+# Bond connectivity of the supercell shown by the frontend crystal plot.
+# Shared by the populate scripts (and the connectivity benchmark), so the bond
+# criterion lives in one place.
+
+from typing import Any, Sequence, Tuple
+import numpy as np
+from ase import Atoms
+from ase.build import make_supercell
+from ase.data import covalent_radii
+from ase.neighborlist import neighbor_list
+
+# The frontend draws a 2x2x1 supercell, so connectivity indices refer to it
+SUPERCELL = (2, 2, 1)
+
+# Two atoms are bonded when closer than this times the sum of their covalent radii
+BOND_SCALE = 1.25
+
+def build_supercell(
+    symbols: Sequence[str],
+    positions: Sequence[Sequence[float]],
+    cell: Any,
+    supercell: Sequence[int] = SUPERCELL,
+) -> Atoms:
+    """Periodic ASE Atoms for the given repetition of the unit cell."""
+    atoms = Atoms(symbols=symbols, positions=positions, cell=cell, pbc=True)
+    return make_supercell(atoms, np.diag(supercell))
+
+def supercell_bonds(
+    symbols: Sequence[str],
+    positions: Sequence[Sequence[float]],
+    cell: Any,
+    supercell: Sequence[int] = SUPERCELL,
+    scale: float = BOND_SCALE,
+) -> Tuple[np.ndarray, int]:
+    """
+    Bonds between atoms of the supercell.
+
+    Returns (edges, n_sites) where edges is an (m, 2) int array of index pairs
+    i < j, sorted by i then j. Only pairs inside the same supercell image count
+    (bonds through a periodic boundary would be drawn across the whole plot).
+    """
+    atoms = build_supercell(symbols, positions, cell, supercell)
+    radii = covalent_radii[atoms.numbers]
+
+    # one neighbor search at the largest possible bond length, then one mask
+    cutoff = scale * 2 * radii.max() if len(atoms) else 0.0
+    i, j, d, S = neighbor_list("ijdS", atoms, cutoff)
+    mask = (i < j) & ~S.any(axis=1) & (d <= scale * (radii[i] + radii[j]))
+
+    i, j = i[mask], j[mask]
+    order = np.lexsort((j, i))
+    edges = np.stack([i[order], j[order]], axis=1)
+    return edges, len(atoms)
+
+def bonds_to_matrix(edges: np.ndarray, n_sites: int) -> np.ndarray:
+    """Dense symmetric 0/1 adjacency matrix from an edge list."""
+    matrix = np.zeros((n_sites, n_sites), dtype=int)
+    matrix[edges[:, 0], edges[:, 1]] = 1
+    matrix[edges[:, 1], edges[:, 0]] = 1
+    return matrix
@@ -0,0 +1,99 @@
+# Downsampled (level-of-detail) copies of the band structure and DOS, precomputed
+# at ingest so plot previews do not have to fetch the full arrays.
+# Band and DOS energies in the JSON files are already relative to the Fermi level.
+
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+# lod -> energy window (eV around E_F), max DOS points, points kept per k-path
+# segment and decimals kept in the JSON. lod 0 is the full data in dos_bands;
+# lod 3 is sized for card previews.
+LOD_LEVELS: Dict[int, Dict[str, Any]] = {
+    1: {"window": (-6.0, 6.0), "dos_points": 400, "band_points": 25, "decimals": 4},
+    2: {"window": (-4.0, 4.0), "dos_points": 120, "band_points": 10, "decimals": 3},
+    3: {"window": (-2.0, 2.0), "dos_points": 60, "band_points": 5, "decimals": 2},
+}
+
+def decimate_dos_indices(
+    energies: np.ndarray,
+    dos: np.ndarray,
+    window: Tuple[float, float],
+    max_points: int,
+) -> np.ndarray:
+    """
+    Indices of the DOS samples to keep: only energies inside the window, then
+    the minimum and maximum of each bucket so peaks and gaps survive.
+    """
+    inside = np.flatnonzero((energies >= window[0]) & (energies <= window[1]))
+    if len(inside) <= max_points:
+        return inside
+    keep = [inside[0], inside[-1]]
+    for bucket in np.array_split(inside, max(max_points // 2, 1)):
+        values = dos[bucket]
+        keep += [bucket[np.argmin(values)], bucket[np.argmax(values)]]
+    return np.unique(keep)
+
+def decimate_bands(
+    bands: np.ndarray,
+    distances: np.ndarray,
+    window: Tuple[float, float],
+    points: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Keep the bands that enter the energy window anywhere along the path and
+    evenly spaced k-points (always including both ends) in every segment.
+    bands is (segments, bands, k-points), distances (segments, k-points).
+    """
+    in_window = (bands.max(axis=(0, 2)) >= window[0]) & (bands.min(axis=(0, 2)) <= window[1])
+    k = np.unique(np.linspace(0, bands.shape[2] - 1, min(points, bands.shape[2])).round().astype(int))
+    return bands[:, in_window][:, :, k], distances[:, k]
+
+def rounded(array: np.ndarray, decimals: int) -> list:
+    return np.round(array, decimals).tolist()
+
+def compute_lods(raw: Dict, levels: Dict[int, Dict[str, Any]] = LOD_LEVELS) -> Dict[int, Dict[str, Any]]:
+    """
+    Plot documents per LOD level, with the same keys as a dos_bands row
+    (bands, band distances, bands soc, band distances soc, density of states
+    energies, total density of states, projected density of states, KPoints,
+    fermi energy). Datasets missing from raw are left out.
+    """
+    energies: Optional[np.ndarray] = None
+    if raw.get("density of states energies") and raw.get("total density of states"):
+        energies = np.asarray(raw["density of states energies"], dtype=float)
+        total_dos = np.asarray(raw["total density of states"], dtype=float)
+        pdos: List[Sequence] = raw.get("projected density of states") or []
+        pdos_values = np.asarray([values for _, values in pdos], dtype=float)
+
+    band_sets = []
+    for bands_key, distances_key in (("bands", "band distances"), ("bands soc", "band distances soc")):
+        if raw.get(bands_key) and raw.get(distances_key):
+            band_sets.append((
+                bands_key,
+                distances_key,
+                np.asarray(raw[bands_key], dtype=float),
+                np.asarray(raw[distances_key], dtype=float),
+            ))
+
+    documents: Dict[int, Dict[str, Any]] = {}
+    for lod, level in levels.items():
+        decimals = level["decimals"]
+        document: Dict[str, Any] = {
+            "KPoints": raw.get("KPoints"),
+            "fermi energy": raw.get("fermi energy"),
+        }
+        for bands_key, distances_key, bands, distances in band_sets:
+            bands, distances = decimate_bands(bands, distances, level["window"], level["band_points"])
+            document[bands_key] = rounded(bands, decimals)
+            document[distances_key] = rounded(distances, decimals)
+        if energies is not None:
+            keep = decimate_dos_indices(energies, total_dos, level["window"], level["dos_points"])
+            document["density of states energies"] = rounded(energies[keep], decimals)
+            document["total density of states"] = rounded(total_dos[keep], decimals)
+            if len(pdos_values):
+                pdos_kept = rounded(pdos_values[:, keep], decimals)
+                document["projected density of states"] = [
+                    [label, values] for (label, _), values in zip(pdos, pdos_kept)
+                ]
+        documents[lod] = document
+    return documents
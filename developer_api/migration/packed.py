@@ -0,0 +1,17 @@
+# Band/DOS arrays that can also be stored as compact little-endian float32 bytea
+# ("<name> f32", with their shapes in "f32 shapes"). Written by the v6 populate
+# script (--storage float32/both) and decoded by the API (which imports it as
+# migration.packed), so both read the list from here.
+
+from typing import List
+
+# dos_bands arrays that --storage float32/both also writes to "<name> f32"
+PACKED_ARRAYS: List[str] = [
+    "bands",
+    "band distances",
+    "bands soc",
+    "band distances soc",
+    "density of states energies",
+    "total density of states",
+    "projected density of states",
+]
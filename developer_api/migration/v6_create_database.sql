@@ -0,0 +1,245 @@
+-- Trigram extension
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+DROP TABLE IF EXISTS hashtable;
+CREATE TABLE hashtable (
+    id bigserial PRIMARY key,
+    hash TEXT UNIQUE,
+    created_at TIMESTAMPTZ DEFAULT now()
+);
+
+DROP TABLE IF EXISTS data;
+CREATE TABLE data (
+    id INTEGER PRIMARY KEY REFERENCES hashtable(id) ON DELETE CASCADE,
+    search_vector tsvector,
+    hash TEXT UNIQUE,
+    "MP-ID" TEXT,
+    "formula" TEXT,
+    "chemical_symbols" TEXT[],
+    "composition" JSONB,  -- element -> count parsed from the formula
+    "reduced formula" TEXT,
+    "spacegroup" TEXT,
+    "cell" JSONB,
+    "symbols" TEXT[],
+    "connectivity" int[][],  -- (m, 2) bonded pairs i < j of the 2x2x1 supercell
+    "connectivity sites" INTEGER,  -- number of supercell atoms, to expand connectivity to n x n
+    "positions" DOUBLE PRECISION[],
+    "vdw gap" DOUBLE PRECISION,
+    "bond length deviation" JSONB,
+    "bond angle deviation" JSONB,
+    "mass density" DOUBLE PRECISION,
+    "total energy" DOUBLE PRECISION,
+    "total energy_soc" DOUBLE PRECISION,
+    "cohesive energy" DOUBLE PRECISION,
+    "exfoliation energy" DOUBLE PRECISION,
+    "born effective charge tensor" DOUBLE PRECISION,
+    "born effective charge q_xy" DOUBLE PRECISION,
+    "born effective charge q_z" DOUBLE PRECISION,
+    "dielectric constant XY" DOUBLE PRECISION,
+    "dielectric constant Z" DOUBLE PRECISION,
+    "bader charge" JSONB,
+    "density of states at fermi" DOUBLE PRECISION,
+    "effective mass" DOUBLE PRECISION,
+    "vbm" DOUBLE PRECISION[],
+    "cbm" DOUBLE PRECISION[],
+    "band gap" DOUBLE PRECISION,
+    "vbm soc" DOUBLE PRECISION[],
+    "cbm soc" DOUBLE PRECISION[],
+    "band gap soc" DOUBLE PRECISION,
+    "layered?" BOOLEAN,
+    "component layers" TEXT[],
+    "KPath" TEXT[],
+    "band locations" TEXT,
+    "band soc location" TEXT,
+    "dos location" TEXT
+);
+
+-- Element fractions per material, kept in sync with data.composition by a trigger.
+-- (element, fraction) is B-tree indexed for composition-range queries like Te > 0.5.
+DROP TABLE IF EXISTS material_elements;
+CREATE TABLE material_elements (
+    id INTEGER REFERENCES data(id) ON DELETE CASCADE,
+    element TEXT NOT NULL,
+    count DOUBLE PRECISION NOT NULL,
+    fraction DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (id, element)
+);
+CREATE INDEX idx_material_elements_fraction ON material_elements (element, fraction);
+
+DROP TABLE IF EXISTS dos_bands;
+CREATE TABLE dos_bands (
+    id INTEGER PRIMARY KEY REFERENCES hashtable(id) ON DELETE CASCADE,
+    hash TEXT UNIQUE,
+    "bands" DOUBLE PRECISION[],
+    "band distances" DOUBLE PRECISION[],
+    "KPoints" JSONB,
+    "bands soc" DOUBLE PRECISION[],
+    "band distances soc" DOUBLE PRECISION[],
+    "density of states energies" DOUBLE PRECISION[],
+    "total density of states" DOUBLE PRECISION[],
+    "projected density of states" JSONB,
+    "fermi energy" DOUBLE PRECISION,
+    -- optional little-endian float32 copies of the arrays above (populate --storage float32/both)
+    "bands f32" BYTEA,
+    "band distances f32" BYTEA,
+    "bands soc f32" BYTEA,
+    "band distances soc f32" BYTEA,
+    "density of states energies f32" BYTEA,
+    "total density of states f32" BYTEA,
+    "projected density of states f32" BYTEA,
+    "projected density of states labels" TEXT[],
+    "f32 shapes" JSONB  -- array name -> shape, e.g. {"bands": [5, 128, 50]}
+);
+
+-- Downsampled copies of the dos_bands plot data per level of detail (see lod.py)
+DROP TABLE IF EXISTS dos_bands_lod;
+CREATE TABLE dos_bands_lod (
+    id INTEGER REFERENCES hashtable(id) ON DELETE CASCADE,
+    hash TEXT NOT NULL,
+    lod SMALLINT NOT NULL,
+    plotinfo JSONB NOT NULL,
+    PRIMARY KEY (id, lod)
+);
+CREATE UNIQUE INDEX idx_dos_bands_lod_hash ON dos_bands_lod (hash, lod);
+
+-- Files the populate script has ingested, so unchanged files can be skipped
+DROP TABLE IF EXISTS ingest_manifest;
+CREATE TABLE ingest_manifest (
+    path TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    mtime DOUBLE PRECISION NOT NULL,
+    content_hash TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+
+-- Create a function to update the search vector
+CREATE OR REPLACE FUNCTION update_search_vector() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector := 
+        setweight(to_tsvector('english', COALESCE(NEW."MP-ID", '')), 'A') ||
+        setweight(to_tsvector('english', COALESCE(NEW.formula, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(NEW.spacegroup, '')), 'B') ||
+        setweight(to_tsvector('english', COALESCE(array_to_string(NEW.symbols, ' '), '')), 'C');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create trigger to auto-update search vector
+CREATE TRIGGER update_search_vector_trigger
+    BEFORE INSERT OR UPDATE ON data
+    FOR EACH ROW EXECUTE FUNCTION update_search_vector();
+
+-- Create a function to rewrite the element fractions of a material
+CREATE OR REPLACE FUNCTION update_material_elements() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM material_elements WHERE id = NEW.id;
+    INSERT INTO material_elements (id, element, count, fraction)
+    SELECT NEW.id, e.key, e.value::double precision,
+           e.value::double precision / sum(e.value::double precision) OVER ()
+    FROM jsonb_each_text(NEW.composition) AS e;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Create trigger to keep material_elements in sync
+CREATE TRIGGER update_material_elements_trigger
+    AFTER INSERT OR UPDATE OF composition ON data
+    FOR EACH ROW EXECUTE FUNCTION update_material_elements();
+
+-- Create GIN index for fast searching
+CREATE INDEX idx_material_search ON data USING GIN(search_vector);
+
+-- Create trigram index on formula
+CREATE INDEX idx_formula_trgm ON data USING GIN (formula gin_trgm_ops);
+
+-- Create trigram indexes on MP-ID and spacegroup
+CREATE INDEX idx_mp_id_trgm ON data USING GIN ("MP-ID" gin_trgm_ops);
+CREATE INDEX idx_spacegroup_trgm ON data USING GIN (spacegroup gin_trgm_ops);
+
+-- Create GIN index for element-set (array containment) search
+CREATE INDEX idx_chemical_symbols ON data USING GIN (chemical_symbols);
+
+-- Create B-tree indexes on the numeric properties screened with /filter
+CREATE INDEX idx_band_gap ON data ("band gap");
+CREATE INDEX idx_band_gap_soc ON data ("band gap soc");
+CREATE INDEX idx_exfoliation_energy ON data ("exfoliation energy");
+CREATE INDEX idx_vdw_gap ON data ("vdw gap");
+CREATE INDEX idx_effective_mass ON data ("effective mass");
+CREATE INDEX idx_dielectric_constant ON data ("dielectric constant XY", "dielectric constant Z");
+
+-- Facet counts for the list page: materials per element, spacegroup and layered?,
+-- plus 20-bin histograms of the main descriptors. Refreshed by the populate script.
+CREATE MATERIALIZED VIEW material_facets AS
+WITH numeric_values AS (
+    SELECT v.facet, v.value
+    FROM data, LATERAL (VALUES
+        ('band gap', "band gap"),
+        ('band gap soc', "band gap soc"),
+        ('exfoliation energy', "exfoliation energy"),
+        ('vdw gap', "vdw gap"),
+        ('cohesive energy', "cohesive energy")
+    ) AS v(facet, value)
+    WHERE v.value IS NOT NULL
+),
+ranges AS (
+    SELECT facet, min(value) AS low, max(value) AS high FROM numeric_values GROUP BY facet
+),
+binned AS (
+    SELECT n.facet, r.low, r.high,
+           CASE WHEN r.high = r.low THEN 0
+                ELSE LEAST(floor((n.value - r.low) / (r.high - r.low) * 20), 19)::int END AS bin
+    FROM numeric_values n JOIN ranges r USING (facet)
+)
+SELECT 'total' AS facet, '' AS value, NULL::double precision AS lower, NULL::double precision AS upper, count(*) AS count
+FROM data
+UNION ALL
+SELECT 'element', symbol, NULL, NULL, count(*)
+FROM data, unnest(chemical_symbols) AS symbol
+GROUP BY symbol
+UNION ALL
+SELECT 'spacegroup', spacegroup, NULL, NULL, count(*)
+FROM data WHERE spacegroup IS NOT NULL
+GROUP BY spacegroup
+UNION ALL
+SELECT 'layered', COALESCE("layered?"::text, 'unknown'), NULL, NULL, count(*)
+FROM data
+GROUP BY 2
+UNION ALL
+SELECT facet, bin::text, low + bin * (high - low) / 20, low + (bin + 1) * (high - low) / 20, count(*)
+FROM binned
+GROUP BY facet, bin, low, high;
+
+-- unique index so the populate script can refresh without blocking readers
+CREATE UNIQUE INDEX idx_material_facets ON material_facets (facet, value);
+
+-- Enable Row Level Security
+ALTER TABLE public.data ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.hashtable ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.dos_bands ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.ingest_manifest ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.dos_bands_lod ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.material_elements ENABLE ROW LEVEL SECURITY;
+
+CREATE POLICY "Deny all access by default" ON public.data
+FOR ALL TO public
+USING (false);
+
+CREATE POLICY "Deny all access by default" ON public.dos_bands
+FOR ALL TO public
+USING (false);
+
+CREATE POLICY "Deny all access by default" ON public.hashtable
+FOR ALL TO public
+USING (false);
+
+CREATE POLICY "Deny all access by default" ON public.ingest_manifest
+FOR ALL TO public
+USING (false);
+
+CREATE POLICY "Deny all access by default" ON public.dos_bands_lod
+FOR ALL TO public
+USING (false);
+
+CREATE POLICY "Deny all access by default" ON public.material_elements
+FOR ALL TO public
+USING (false);
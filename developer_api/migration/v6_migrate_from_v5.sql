@@ -0,0 +1,196 @@
+-- Upgrade a populated v5 database to the v6 schema in place.
+-- Run with: psql -U postgres -d local_db -f ./developer_api/migration/v6_migrate_from_v5.sql
+BEGIN;
+
+-- Connectivity: dense n x n matrix -> (m, 2) edge list of bonded pairs i < j (0-based)
+ALTER TABLE data ADD COLUMN IF NOT EXISTS "connectivity sites" INTEGER;
+
+UPDATE data SET
+    "connectivity sites" = array_length(connectivity, 1),
+    connectivity = COALESCE((
+        SELECT array_agg(ARRAY[i - 1, j - 1] ORDER BY i, j)
+        FROM generate_subscripts(connectivity, 1) AS i,
+             generate_subscripts(connectivity, 2) AS j
+        WHERE i < j AND connectivity[i][j] <> 0
+    ), '{}')
+WHERE connectivity IS NOT NULL
+  AND "connectivity sites" IS NULL;  -- rows already converted keep their edge list
+
+-- Optional float32 storage of band/DOS arrays, filled by v6_populate_database_from_json.py --storage
+ALTER TABLE dos_bands
+    ADD COLUMN IF NOT EXISTS "bands f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "band distances f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "bands soc f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "band distances soc f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "density of states energies f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "total density of states f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "projected density of states f32" BYTEA,
+    ADD COLUMN IF NOT EXISTS "projected density of states labels" TEXT[],
+    ADD COLUMN IF NOT EXISTS "f32 shapes" JSONB;
+
+-- Files the populate script has ingested (v5 databases made before the manifest lack it)
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    path TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    mtime DOUBLE PRECISION NOT NULL,
+    content_hash TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+ALTER TABLE public.ingest_manifest ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Deny all access by default" ON public.ingest_manifest;
+CREATE POLICY "Deny all access by default" ON public.ingest_manifest
+FOR ALL TO public
+USING (false);
+
+-- Downsampled plot data, filled by v6_populate_database_from_json.py
+CREATE TABLE IF NOT EXISTS dos_bands_lod (
+    id INTEGER REFERENCES hashtable(id) ON DELETE CASCADE,
+    hash TEXT NOT NULL,
+    lod SMALLINT NOT NULL,
+    plotinfo JSONB NOT NULL,
+    PRIMARY KEY (id, lod)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_dos_bands_lod_hash ON dos_bands_lod (hash, lod);
+ALTER TABLE public.dos_bands_lod ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Deny all access by default" ON public.dos_bands_lod;
+CREATE POLICY "Deny all access by default" ON public.dos_bands_lod
+FOR ALL TO public
+USING (false);
+
+-- Trigram indexes for similarity search on MP-ID and spacegroup (formula already has one)
+CREATE INDEX IF NOT EXISTS idx_mp_id_trgm ON data USING GIN ("MP-ID" gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_spacegroup_trgm ON data USING GIN (spacegroup gin_trgm_ops);
+
+-- chemical_symbols: split the formula on element symbols ("GeTe" was stored as {gete}), lowercase, unique
+UPDATE data SET chemical_symbols = (
+    SELECT array_agg(symbol ORDER BY first)
+    FROM (
+        SELECT lower(m[1]) AS symbol, min(n) AS first
+        FROM regexp_matches(formula, '([A-Z][a-z]?)', 'g') WITH ORDINALITY AS r(m, n)
+        GROUP BY 1
+    ) AS symbols
+)
+WHERE formula ~ '[A-Z]';
+CREATE INDEX IF NOT EXISTS idx_chemical_symbols ON data USING GIN (chemical_symbols);
+
+-- Stoichiometry: element -> count, reduced formula and an indexed element-fraction table.
+-- The backfill handles plain formulas like "Bi2Te3"; formulas with groups need
+-- v6_populate_database_from_json.py (see composition.py).
+ALTER TABLE data
+    ADD COLUMN IF NOT EXISTS composition JSONB,
+    ADD COLUMN IF NOT EXISTS "reduced formula" TEXT;
+
+CREATE TABLE IF NOT EXISTS material_elements (
+    id INTEGER REFERENCES data(id) ON DELETE CASCADE,
+    element TEXT NOT NULL,
+    count DOUBLE PRECISION NOT NULL,
+    fraction DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (id, element)
+);
+CREATE INDEX IF NOT EXISTS idx_material_elements_fraction ON material_elements (element, fraction);
+ALTER TABLE public.material_elements ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Deny all access by default" ON public.material_elements;
+CREATE POLICY "Deny all access by default" ON public.material_elements
+FOR ALL TO public
+USING (false);
+
+CREATE OR REPLACE FUNCTION update_material_elements() RETURNS trigger AS $$
+BEGIN
+    DELETE FROM material_elements WHERE id = NEW.id;
+    INSERT INTO material_elements (id, element, count, fraction)
+    SELECT NEW.id, e.key, e.value::double precision,
+           e.value::double precision / sum(e.value::double precision) OVER ()
+    FROM jsonb_each_text(NEW.composition) AS e;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS update_material_elements_trigger ON data;
+CREATE TRIGGER update_material_elements_trigger
+    AFTER INSERT OR UPDATE OF composition ON data
+    FOR EACH ROW EXECUTE FUNCTION update_material_elements();
+
+-- dropped first so the script can be re-run in the same session after a failed attempt
+DROP AGGREGATE IF EXISTS pg_temp.gcd_agg(numeric);
+CREATE AGGREGATE pg_temp.gcd_agg(numeric) (SFUNC = gcd, STYPE = numeric);
+
+WITH counts AS (
+    SELECT d.id, m.match[1] AS element, min(m.n) AS position,
+           sum(COALESCE(NULLIF(m.match[2], '')::numeric, 1)) AS count
+    FROM data d,
+         regexp_matches(d.formula, '([A-Z][a-z]?)(\d+(?:\.\d+)?)?', 'g') WITH ORDINALITY AS m(match, n)
+    WHERE d.formula ~ '^([A-Z][a-z]?(\d+(\.\d+)?)?)+$'
+    GROUP BY d.id, m.match[1]
+),
+divisors AS (
+    SELECT id, pg_temp.gcd_agg(count) AS divisor FROM counts GROUP BY id
+)
+UPDATE data SET
+    composition = c.composition,
+    "reduced formula" = c.reduced
+FROM (
+    SELECT counts.id,
+           jsonb_object_agg(element, count) AS composition,
+           string_agg(
+               element || CASE WHEN count = divisor THEN '' ELSE trim_scale(count / divisor)::text END,
+               '' ORDER BY position
+           ) AS reduced
+    FROM counts JOIN divisors USING (id)
+    GROUP BY counts.id
+) AS c
+WHERE data.id = c.id AND data.composition IS NULL;
+
+-- B-tree indexes on the numeric properties screened with /filter
+CREATE INDEX IF NOT EXISTS idx_band_gap ON data ("band gap");
+CREATE INDEX IF NOT EXISTS idx_band_gap_soc ON data ("band gap soc");
+CREATE INDEX IF NOT EXISTS idx_exfoliation_energy ON data ("exfoliation energy");
+CREATE INDEX IF NOT EXISTS idx_vdw_gap ON data ("vdw gap");
+CREATE INDEX IF NOT EXISTS idx_effective_mass ON data ("effective mass");
+CREATE INDEX IF NOT EXISTS idx_dielectric_constant ON data ("dielectric constant XY", "dielectric constant Z");
+
+-- Facet counts for the list page: materials per element, spacegroup and layered?,
+-- plus 20-bin histograms of the main descriptors. Refreshed by the populate script.
+CREATE MATERIALIZED VIEW IF NOT EXISTS material_facets AS
+WITH numeric_values AS (
+    SELECT v.facet, v.value
+    FROM data, LATERAL (VALUES
+        ('band gap', "band gap"),
+        ('band gap soc', "band gap soc"),
+        ('exfoliation energy', "exfoliation energy"),
+        ('vdw gap', "vdw gap"),
+        ('cohesive energy', "cohesive energy")
+    ) AS v(facet, value)
+    WHERE v.value IS NOT NULL
+),
+ranges AS (
+    SELECT facet, min(value) AS low, max(value) AS high FROM numeric_values GROUP BY facet
+),
+binned AS (
+    SELECT n.facet, r.low, r.high,
+           CASE WHEN r.high = r.low THEN 0
+                ELSE LEAST(floor((n.value - r.low) / (r.high - r.low) * 20), 19)::int END AS bin
+    FROM numeric_values n JOIN ranges r USING (facet)
+)
+SELECT 'total' AS facet, '' AS value, NULL::double precision AS lower, NULL::double precision AS upper, count(*) AS count
+FROM data
+UNION ALL
+SELECT 'element', symbol, NULL, NULL, count(*)
+FROM data, unnest(chemical_symbols) AS symbol
+GROUP BY symbol
+UNION ALL
+SELECT 'spacegroup', spacegroup, NULL, NULL, count(*)
+FROM data WHERE spacegroup IS NOT NULL
+GROUP BY spacegroup
+UNION ALL
+SELECT 'layered', COALESCE("layered?"::text, 'unknown'), NULL, NULL, count(*)
+FROM data
+GROUP BY 2
+UNION ALL
+SELECT facet, bin::text, low + bin * (high - low) / 20, low + (bin + 1) * (high - low) / 20, count(*)
+FROM binned
+GROUP BY facet, bin, low, high;
+
+-- unique index so the populate script can refresh without blocking readers
+CREATE UNIQUE INDEX IF NOT EXISTS idx_material_facets ON material_facets (facet, value);
+
+COMMIT;
@@ -0,0 +1,676 @@
+# changes from v5 -> v6:
+# 1) Store connectivity as a sparse edge list of bonded pairs plus the supercell size,
+#    instead of a dense n x n matrix (see v6_migrate_from_v5.sql for existing rows)
+# 2) Optional compact storage of band/DOS arrays as little-endian float32 bytea (--storage)
+# 3) Precompute downsampled band/DOS plot data per level of detail into dos_bands_lod (see lod.py)
+# 4) Trigram indexes on "MP-ID" and spacegroup for similarity search (schema only)
+# 5) chemical_symbols split on element symbols before lowercasing ("GeTe" -> ge, te, not gete),
+#    and GIN-indexed for element-set search
+# 6) Parse the formula (composition.py) into composition (element -> count) and reduced formula;
+#    a trigger fills the indexed material_elements fractions from composition
+# 7) B-tree indexes on the commonly screened numeric properties (schema only)
+# 8) material_facets materialized view of facet counts, refreshed after every ingest that changed data
+
+from hashlib import md5
+import argparse
+import os
+import json
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from composition import parse_formula, reduced_formula
+from connectivity import supercell_bonds
+from lod import compute_lods
+from packed import PACKED_ARRAYS
+
+import psycopg
+from psycopg.types.json import Jsonb
+
+from math import isnan, isinf
+
+DATA_COLUMN_TYPES = {
+    "MP-ID": str,
+    "formula": str,
+    "chemical_symbols": list,
+    "composition": dict,
+    "reduced formula": str,
+    "spacegroup": str,
+    "cell": dict,
+    "symbols": list,
+    "connectivity": list,
+    "connectivity sites": int,
+    "positions": list,
+    "vdw gap": float,
+    "bond length deviation": dict,
+    "bond angle deviation": dict,
+    "mass density": float,
+    "total energy": float,
+    "total energy_soc": float,
+    "cohesive energy": float,
+    "exfoliation energy": float,
+    "born effective charge tensor": float,
+    "born effective charge q_xy": float,
+    "born effective charge q_z": float,
+    "dielectric constant XY": float,
+    "dielectric constant Z": float,
+    "bader charge": dict,
+    "density of states at fermi": float,
+    "effective mass": float,
+    "vbm": list,
+    "cbm": list,
+    "band gap": float,
+    "vbm soc": list,
+    "cbm soc": list,
+    "band gap soc": float,
+    "layered?": bool,
+    "component layers": list,
+    "KPath": list,
+    "band locations": str,
+    "band soc location": str,
+    "dos location": str
+}
+
+DOS_BANDS_COLUMN_TYPES = {
+    "bands": list,
+    "band distances": list,
+    "KPoints": dict,
+    "bands soc": list,
+    "band distances soc": list,
+    "density of states energies": list,
+    "total density of states": list,
+    "projected density of states": dict,
+    "fermi energy": float,
+    # compact float32 copies of PACKED_ARRAYS, see pack_arrays
+    **{f"{key} f32": bytes for key in PACKED_ARRAYS},
+    "projected density of states labels": list,
+    "f32 shapes": dict
+}
+
+PACKED_COLUMNS = [f"{key} f32" for key in PACKED_ARRAYS] + ["projected density of states labels", "f32 shapes"]
+
+STORAGE_MODES = ["double", "float32", "both"]
+
+def cast_value(value: Any, target_type: type) -> Optional[Any]:
+    """Cast value to target Python type, return None for invalid values."""
+    if value is None:
+        return None
+    if isinstance(value, str) and value.strip().upper() == "UNKNOWN":
+        return None
+    if isinstance(value, list) and len(value) == 0:
+        return None
+    if isinstance(value, float) and (isnan(value) or isinf(value)):
+        return None
+
+    try:
+        if target_type == str:
+            return str(value)
+        elif target_type == bool:
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str):
+                return value.lower() in ('true', '1', 'yes', 'y')
+            return bool(value)
+        elif target_type == float:
+            return float(value)
+        elif target_type == int:
+            return int(value)
+        elif target_type == list:
+            if isinstance(value, list):
+                return value
+            if isinstance(value, dict):
+                return None  # no array column can hold a mapping (e.g. "symbols": {})
+            return [value]
+        elif target_type == dict:
+            if isinstance(value, (dict, list)):
+                return json.dumps(value, sort_keys=True)
+            return json.dumps({"value": value}, sort_keys=True)
+        else:
+            return value
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+def get_or_create_hash_id(cur, hash_str: str) -> int:
+    cur.execute(
+        """
+        INSERT INTO hashtable (hash)
+        VALUES (%s)
+        ON CONFLICT (hash) DO NOTHING
+        RETURNING id;
+        """,
+        (hash_str,),
+    )
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    cur.execute("SELECT id FROM hashtable WHERE hash = %s;", (hash_str,))
+    row = cur.fetchone()
+    if row:
+        return row[0]
+    raise RuntimeError("Could not obtain hash id")
+
+class FileEntry(NamedTuple):
+    """Manifest entry for one JSON file; path is relative to the JSON directory."""
+    path: str
+    size: int
+    mtime: float
+    content_hash: str
+
+def file_content_hash(path: str) -> str:
+    """md5 of the raw file bytes (cheap: no JSON parsing)."""
+    with open(path, "rb") as f:
+        return md5(f.read()).hexdigest()
+
+MANIFEST_DDL = """
+CREATE TABLE IF NOT EXISTS ingest_manifest (
+    path TEXT PRIMARY KEY,
+    size BIGINT NOT NULL,
+    mtime DOUBLE PRECISION NOT NULL,
+    content_hash TEXT NOT NULL,
+    hash TEXT NOT NULL
+);
+ALTER TABLE public.ingest_manifest ENABLE ROW LEVEL SECURITY;
+DROP POLICY IF EXISTS "Deny all access by default" ON public.ingest_manifest;
+CREATE POLICY "Deny all access by default" ON public.ingest_manifest
+FOR ALL TO public
+USING (false);
+"""
+
+def load_manifest(conn) -> Dict[str, Tuple[int, float, str, str]]:
+    """
+    Map path -> (size, mtime, content_hash, hash) for every previously ingested
+    file. Creates ingest_manifest first on databases made before it existed.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('public.ingest_manifest') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            cur.execute(MANIFEST_DDL)
+        cur.execute("SELECT path, size, mtime, content_hash, hash FROM ingest_manifest;")
+        return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+def plan_ingest(
+    json_root: str,
+    paths: List[str],
+    manifest: Dict[str, Tuple[int, float, str, str]],
+    full: bool = False,
+) -> Tuple[Dict[str, FileEntry], List[FileEntry], List[str]]:
+    """
+    Compare the files on disk against the manifest.
+
+    Returns (to_ingest, touched, removed): files that are new or whose content
+    changed (keyed by full path), files whose size/mtime changed but whose
+    bytes did not, and manifest paths that no longer exist on disk. Files with
+    the same size and mtime are not even read. With full=True every file is
+    ingested again.
+    """
+    to_ingest: Dict[str, FileEntry] = {}
+    touched: List[FileEntry] = []
+    on_disk = set()
+    for path in paths:
+        rel = os.path.relpath(path, json_root)
+        on_disk.add(rel)
+        st = os.stat(path)
+        known = manifest.get(rel)
+        if not full and known and known[0] == st.st_size and known[1] == st.st_mtime:
+            continue
+        entry = FileEntry(rel, st.st_size, st.st_mtime, file_content_hash(path))
+        if not full and known and known[2] == entry.content_hash:
+            touched.append(entry)
+            continue
+        to_ingest[path] = entry
+    removed = [p for p in manifest if p not in on_disk]
+    return to_ingest, touched, removed
+
+def sync_manifest(
+    conn,
+    written: Dict[str, Tuple[FileEntry, str]],
+    touched: List[FileEntry],
+    removed: List[str],
+    manifest: Dict[str, Tuple[int, float, str, str]],
+) -> int:
+    """
+    Record ingested and touched files in the manifest, forget removed ones and
+    delete materials no file points at anymore (removed files, or files whose
+    content hash changed). Deleting from hashtable cascades to data/dos_bands.
+
+    Returns the number of materials deleted.
+    """
+    rows = [(*entry, hash_str) for entry, hash_str in written.values()]
+    rows += [(*entry, manifest[entry.path][3]) for entry in touched]
+    stale = [manifest[p][3] for p in removed]
+    stale += [
+        manifest[p][3] for p, (_, hash_str) in written.items()
+        if p in manifest and manifest[p][3] != hash_str
+    ]
+
+    with conn.transaction():
+        with conn.cursor() as cur:
+            if rows:
+                cur.executemany(
+                    """
+                    INSERT INTO ingest_manifest (path, size, mtime, content_hash, hash)
+                    VALUES (%s, %s, %s, %s, %s)
+                    ON CONFLICT (path) DO UPDATE SET
+                        size = EXCLUDED.size,
+                        mtime = EXCLUDED.mtime,
+                        content_hash = EXCLUDED.content_hash,
+                        hash = EXCLUDED.hash;
+                    """,
+                    rows,
+                )
+            if removed:
+                cur.execute("DELETE FROM ingest_manifest WHERE path = ANY(%s);", (removed,))
+            if not stale:
+                return 0
+            # identical files share a hash, so only drop hashes nothing refers to anymore
+            cur.execute(
+                """
+                DELETE FROM hashtable
+                WHERE hash = ANY(%s) AND hash NOT IN (SELECT hash FROM ingest_manifest);
+                """,
+                (stale,),
+            )
+            return cur.rowcount
+
+def refresh_facets(conn) -> None:
+    """Recompute material_facets; CONCURRENTLY keeps it readable by the API meanwhile."""
+    with conn.transaction():
+        conn.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY material_facets;")
+
+def pack_arrays(raw: Dict, file: str) -> Dict[str, Any]:
+    """
+    Little-endian float32 buffers for the PACKED_ARRAYS present in raw, plus
+    their shapes ("f32 shapes") and the projected DOS orbital labels.
+    """
+    row: Dict[str, Any] = {}
+    shapes: Dict[str, List[int]] = {}
+    for key in PACKED_ARRAYS:
+        value = raw.get(key)
+        if not isinstance(value, list) or not value:
+            continue
+        try:
+            if key == "projected density of states":
+                # [[label, [values...]], ...] -> labels and a (n_orbitals, n_energies) array
+                row["projected density of states labels"] = [label for label, _ in value]
+                value = [values for _, values in value]
+            array = np.asarray(value, dtype="<f4")
+        except (ValueError, TypeError) as e:
+            print(f"Failed to pack {key} as float32 for {file}: {e}")
+            continue
+        row[f"{key} f32"] = array.tobytes()
+        shapes[key] = list(array.shape)
+    if shapes:
+        row["f32 shapes"] = json.dumps(shapes, sort_keys=True)
+    return row
+
+def iter_json_files(json_root: str) -> Iterator[str]:
+    """Yield the path of every .json file below json_root."""
+    for root, dirs, files in os.walk(json_root):
+        for file in files:
+            if not file.endswith(".json"):
+                print(f"WARNING: skipping {file}")
+                continue
+            yield os.path.join(root, file)
+
+def prepare_record(path: str, storage: str = "double") -> Optional[Dict[str, Any]]:
+    """
+    Parse one JSON file and compute everything the writer needs: hash, casted
+    data/dos_bands columns, chemical symbols and the connectivity edge list.
+    storage selects float8 arrays ("double"), float32 bytea ("float32") or both.
+
+    Does not touch the database, so it can run in a worker process.
+    """
+    file = os.path.basename(path)
+    with open(path, "r") as f:
+        try:
+            raw: Dict = json.load(f)
+        except Exception as e:
+            print(f"Failed to parse JSON {file}: {e}")
+            return None
+
+    data_blob: str = json.dumps(raw, sort_keys=True, indent=2)
+    hash_str: str = md5(data_blob.encode("utf-8")).hexdigest()
+
+    data_row: Dict[str, Any] = {}
+    for key, target_type in DATA_COLUMN_TYPES.items():
+        if key not in raw:
+            continue
+        casted_value = cast_value(raw[key], target_type)
+        if casted_value is None:
+            continue
+        data_row[key] = casted_value
+
+    # Special handling for chemical symbols and stoichiometry from formula (overwrites if present)
+    try:
+        if "formula" in raw and raw["formula"]:
+            counts = parse_formula(raw["formula"])
+            data_row["chemical_symbols"] = [e.lower() for e in counts]
+            data_row["composition"] = cast_value(counts, dict)
+            data_row["reduced formula"] = reduced_formula(counts)
+    except Exception as e:
+        print(f"Failed to split chemical composition for {file}: {e}")
+
+    # Build connectivity edge list if possible
+    try:
+        if all(k in raw for k in ["symbols", "positions", "cell"]):
+            edges, n_sites = supercell_bonds(raw["symbols"], raw["positions"], raw["cell"]["array"])
+            data_row["connectivity"] = edges.tolist()
+            data_row["connectivity sites"] = n_sites
+    except Exception as e:
+        print(f"Failed to precompute connectivity for {file} --- {e} --- in {raw.get('formula', 'unknown')}")
+
+    # Process DOS/bands data
+    dos_bands_row: Dict[str, Any] = {}
+    for key, value in raw.items():
+        if key in DOS_BANDS_COLUMN_TYPES:
+            target_type = DOS_BANDS_COLUMN_TYPES[key]
+            casted_value = cast_value(value, target_type)
+            if casted_value is not None:
+                dos_bands_row[key] = casted_value
+
+    # explicit NULLs clear whatever an earlier run with another --storage left behind
+    if dos_bands_row and storage != "float32":
+        dos_bands_row.update({key: None for key in PACKED_COLUMNS})
+    if storage != "double":
+        dos_bands_row.update(pack_arrays(raw, file))
+    if storage == "float32":
+        dos_bands_row.update({key: None for key in PACKED_ARRAYS if key in dos_bands_row})
+
+    # Precompute downsampled plot data (JSON text per level of detail)
+    dos_bands_lod: Dict[int, str] = {}
+    try:
+        if dos_bands_row:
+            dos_bands_lod = {lod: json.dumps(doc, allow_nan=False) for lod, doc in compute_lods(raw).items()}
+    except Exception as e:
+        print(f"Failed to precompute plot levels of detail for {file}: {e}")
+
+    return {
+        "path": path,
+        "file": file,
+        "hash": hash_str,
+        "data": data_row,
+        "dos_bands": dos_bands_row,
+        "dos_bands_lod": dos_bands_lod,
+    }
+
+def prepare_records_parallel(paths: List[str], workers: int, storage: str = "double") -> Iterator[Optional[Dict[str, Any]]]:
+    """
+    Run prepare_record over a process pool and yield the results in order.
+
+    At most 2 * workers files are in flight, so prepared band/DOS arrays do not
+    pile up in memory when the writer falls behind.
+    """
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for path in paths:
+            pending.append(executor.submit(prepare_record, path, storage))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+def upsert_row(cur, table: str, material_id: int, hash_str: str, row: Dict[str, Any]) -> None:
+    """INSERT ... ON CONFLICT (id) DO UPDATE for the given (already casted) columns."""
+    cols = ['id', 'hash']
+    vals = [material_id, hash_str]
+    updates = ['hash = EXCLUDED.hash']
+
+    for key, val in row.items():
+        cols.append(f'"{key}"')
+        vals.append(val)
+        updates.append(f'"{key}" = EXCLUDED."{key}"')
+
+    col_list = ", ".join(cols)
+    placeholder_list = ", ".join(["%s"] * len(cols))
+    update_clause = ", ".join(updates)
+
+    cur.execute(
+        f"""
+        INSERT INTO {table} ({col_list})
+        VALUES ({placeholder_list})
+        ON CONFLICT (id) DO UPDATE SET {update_clause};
+        """,
+        vals
+    )
+
+def write_record(conn, record: Dict[str, Any]) -> bool:
+    """Write one prepared record in its own transaction. Returns False on failure."""
+    file = record["file"]
+    try:
+        with conn.transaction():
+            with conn.cursor() as cur:
+                # 1. Insert/get hash ID
+                material_id = get_or_create_hash_id(cur, record["hash"])
+
+                # 2. Upsert into data table (main, including chemical symbols and connectivity)
+                try:
+                    upsert_row(cur, "data", material_id, record["hash"], record["data"])
+                except Exception as e:
+                    print(f"Error upserting main data for {file}: {e}")
+                    raise
+
+                # 3. Upsert DOS/bands data
+                if record["dos_bands"]:
+                    try:
+                        upsert_row(cur, "dos_bands", material_id, record["hash"], record["dos_bands"])
+                    except Exception as e:
+                        print(f"Error in adding DOS and Bands for {file}: {e}")
+                        raise
+
+                # 4. Replace downsampled plot data
+                if record["dos_bands_lod"]:
+                    cur.execute("DELETE FROM dos_bands_lod WHERE id = %s;", (material_id,))
+                    cur.executemany(
+                        """
+                        INSERT INTO dos_bands_lod (id, hash, lod, plotinfo)
+                        VALUES (%s, %s, %s, %s);
+                        """,
+                        [(material_id, record["hash"], lod, doc) for lod, doc in record["dos_bands_lod"].items()],
+                    )
+    except Exception as e:
+        print(f"Transaction failed for {file}: {e}")
+        return False
+    return True
+
+def staged_value(value: Any, target_type: type) -> Any:
+    """Adapt a casted value for binary COPY."""
+    if value is not None and target_type == dict:
+        # cast_value already serialized it; dumps=str stops psycopg from encoding it twice
+        return Jsonb(value, dumps=str)
+    return value
+
+# marks the end of the records in bulk_load (None is a skipped file)
+END = object()
+
+def bulk_load(conn, records: Iterable[Optional[Dict[str, Any]]]) -> int:
+    """
+    Stream every prepared record into one temporary staging table with binary
+    COPY, then merge it into hashtable, data and dos_bands with one set-based
+    upsert per table. Everything happens in a single transaction, so one bad
+    row aborts the whole load.
+
+    Returns the number of materials loaded.
+    """
+    data_cols = list(DATA_COLUMN_TYPES)
+    dos_cols = list(DOS_BANDS_COLUMN_TYPES)
+    staged_cols = ["hash"] + data_cols + dos_cols + ["has_dos_bands", "dos_bands_lod"]
+
+    def quoted(cols: List[str], prefix: str = "") -> str:
+        return ", ".join(f'{prefix}"{c}"' for c in cols)
+
+    start = time.perf_counter()
+    preparing = 0.0  # spent waiting on records (parsing, connectivity), kept out of the load rate
+    seen = set()
+    dos_count = 0
+    with conn.transaction():
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                CREATE TEMP TABLE staging ON COMMIT DROP AS
+                SELECT d.hash, {quoted(data_cols, "d.")}, {quoted(dos_cols, "b.")},
+                       true AS has_dos_bands, NULL::jsonb AS dos_bands_lod
+                FROM data d, dos_bands b
+                WITH NO DATA;
+                """
+            )
+            cur.execute(
+                """
+                SELECT attname, atttypid FROM pg_attribute
+                WHERE attrelid = 'staging'::regclass AND attnum > 0 AND NOT attisdropped;
+                """
+            )
+            oids = dict(cur.fetchall())
+
+            with cur.copy(f"COPY staging ({quoted(staged_cols)}) FROM STDIN (FORMAT BINARY)") as copy:
+                copy.set_types([oids[c] for c in staged_cols])
+                records = iter(records)
+                while True:
+                    before = time.perf_counter()
+                    record = next(records, END)
+                    preparing += time.perf_counter() - before
+                    if record is END:
+                        break
+                    # identical files share a hash; the upserts cannot touch a row twice
+                    if record is None or record["hash"] in seen:
+                        continue
+                    seen.add(record["hash"])
+                    row = [record["hash"]]
+                    row += [staged_value(record["data"].get(c), DATA_COLUMN_TYPES[c]) for c in data_cols]
+                    row += [staged_value(record["dos_bands"].get(c), DOS_BANDS_COLUMN_TYPES[c]) for c in dos_cols]
+                    row.append(bool(record["dos_bands"]))
+                    # {"<lod>": <plot document>, ...}, split into rows of dos_bands_lod below
+                    lods = ", ".join(f'"{lod}": {doc}' for lod, doc in record["dos_bands_lod"].items())
+                    row.append(Jsonb(f"{{{lods}}}", dumps=str) if lods else None)
+                    dos_count += bool(record["dos_bands"])
+                    copy.write_row(row)
+            staged = time.perf_counter()
+
+            cur.execute(
+                """
+                INSERT INTO hashtable (hash)
+                SELECT hash FROM staging
+                ON CONFLICT (hash) DO NOTHING;
+                """
+            )
+            for table, cols, where in (
+                ("data", data_cols, ""),
+                ("dos_bands", dos_cols, "WHERE s.has_dos_bands"),
+            ):
+                updates = ", ".join(f'"{c}" = EXCLUDED."{c}"' for c in cols)
+                cur.execute(
+                    f"""
+                    INSERT INTO {table} (id, hash, {quoted(cols)})
+                    SELECT h.id, s.hash, {quoted(cols, "s.")}
+                    FROM staging s JOIN hashtable h ON h.hash = s.hash
+                    {where}
+                    ON CONFLICT (id) DO UPDATE SET hash = EXCLUDED.hash, {updates};
+                    """
+                )
+            cur.execute(
+                """
+                DELETE FROM dos_bands_lod
+                WHERE hash IN (SELECT hash FROM staging WHERE dos_bands_lod IS NOT NULL);
+                """
+            )
+            cur.execute(
+                """
+                INSERT INTO dos_bands_lod (id, hash, lod, plotinfo)
+                SELECT h.id, s.hash, l.key::smallint, l.value
+                FROM staging s
+                JOIN hashtable h ON h.hash = s.hash
+                CROSS JOIN LATERAL jsonb_each(s.dos_bands_lod) AS l;
+                """
+            )
+    done = time.perf_counter()
+
+    rows = len(seen) + dos_count
+    loading = done - start - preparing
+    print(
+        f"Bulk loaded {len(seen)} materials ({rows} data/dos_bands rows) in {done - start:.2f}s end to end: "
+        f"preparing records {preparing:.2f}s, COPY {staged - start - preparing:.2f}s, merge {done - staged:.2f}s; "
+        f"COPY and merge {rows / loading if loading else 0:.0f} rows/s"
+    )
+    return len(seen)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Populate the v6 database from the material JSON files.")
+    parser.add_argument("--json-dir", default="./backend/json/", help="directory searched recursively for .json files")
+    parser.add_argument("--dbname", default="fastapi_psycopg3")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="number of processes used to parse files and compute connectivity (1 = no pool)",
+    )
+    parser.add_argument(
+        "--bulk",
+        action="store_true",
+        help="load everything with binary COPY and set-based upserts in one transaction",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="ingest every file, even those the manifest says are unchanged",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=STORAGE_MODES,
+        default="double",
+        help="store band/DOS arrays as float8 arrays, float32 bytea, or both "
+        "(use with --full when switching, unchanged files are skipped)",
+    )
+    args = parser.parse_args()
+
+    # Connection (adjust credentials as needed)
+    conn = psycopg.connect(
+        dbname=args.dbname, user="postgres", password="", host="localhost"
+    )
+
+    paths = list(iter_json_files(args.json_dir))
+    manifest = load_manifest(conn)
+    conn.commit()  # end the read transaction so each file below commits on its own
+    to_ingest, touched, removed = plan_ingest(args.json_dir, paths, manifest, full=args.full)
+    print(
+        f"{len(paths) - len(to_ingest) - len(touched)} unchanged, {len(touched)} touched, "
+        f"{len(to_ingest)} to ingest, {len(removed)} removed"
+    )
+
+    pending = list(to_ingest)
+    if args.workers > 1:
+        records = prepare_records_parallel(pending, args.workers, args.storage)
+    else:
+        records = map(partial(prepare_record, storage=args.storage), pending)
+
+    start = time.perf_counter()
+    written: Dict[str, Tuple[FileEntry, str]] = {}
+    with conn:
+        if args.bulk:
+            # the load is all-or-nothing, so every record that reaches it counts as written
+            def track(records):
+                for record in records:
+                    if record is not None:
+                        entry = to_ingest[record["path"]]
+                        written[entry.path] = (entry, record["hash"])
+                    yield record
+
+            bulk_load(conn, track(records))
+        else:
+            for record in records:
+                if record is not None and write_record(conn, record):
+                    entry = to_ingest[record["path"]]
+                    written[entry.path] = (entry, record["hash"])
+        deleted = sync_manifest(conn, written, touched, removed, manifest)
+        if written or deleted:
+            refresh_facets(conn)
+    elapsed = time.perf_counter() - start
+    print(
+        f"Wrote {len(written)}/{len(to_ingest)} materials, deleted {deleted} "
+        f"in {elapsed:.1f}s ({args.workers} worker(s))"
+    )
+
+if __name__ == "__main__":
+    main()
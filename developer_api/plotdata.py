@@ -0,0 +1,135 @@
+# Plot data sliced server-side: only the requested datasets, energy window and
+# PDOS orbitals are read and serialized, with the arrays handled in NumPy.
+
+import struct
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from psycopg import sql
+from psycopg.adapt import Loader
+from psycopg.postgres import types as pg_types
+from psycopg.pq import Format
+
+# datasets a plot request can ask for -> the dos_bands arrays they need
+DATASET_ARRAYS: Dict[str, List[str]] = {
+    "bands": ["bands", "band distances"],
+    "bands_soc": ["bands soc", "band distances soc"],
+    "dos": ["density of states energies", "total density of states"],
+    "pdos": ["density of states energies", "projected density of states"],
+}
+
+FLOAT8_ARRAY_OID = pg_types["float8"].array_oid
+
+class Float8ArrayNumpyLoader(Loader):
+    """Load binary float8[] straight into a NumPy array instead of nested lists."""
+
+    format = Format.BINARY
+
+    def load(self, data) -> np.ndarray:
+        ndim, has_null, _ = struct.unpack_from("!iii", data)
+        if ndim == 0:
+            return np.empty(0)
+        shape = struct.unpack_from(f"!{2 * ndim}i", data, 12)[0::2]
+        offset = 12 + 8 * ndim
+        if not has_null:
+            # every element is a 4 byte length followed by a big-endian double
+            elements = np.frombuffer(data, dtype=[("length", ">i4"), ("value", ">f8")], offset=offset)
+            return elements["value"].astype(float).reshape(shape)
+        values = []
+        while offset < len(data):
+            (length,) = struct.unpack_from("!i", data, offset)
+            offset += 4
+            if length < 0:
+                values.append(np.nan)
+                continue
+            values.append(struct.unpack_from("!d", data, offset)[0])
+            offset += length
+        return np.asarray(values).reshape(shape)
+
+def plot_columns(datasets: Sequence[str]) -> sql.Composed:
+    """
+    dos_bands select list for the given datasets. The float8 column is only
+    read when there is no float32 copy, so each array is transferred once.
+    """
+    names = dict.fromkeys(name for dataset in datasets for name in DATASET_ARRAYS[dataset])
+    columns = [
+        sql.SQL('"KPoints", "fermi energy", "f32 shapes", "projected density of states labels"'),
+    ]
+    for name in names:
+        packed, column = sql.Identifier(f"{name} f32"), sql.Identifier(name)
+        columns.append(packed)
+        columns.append(sql.SQL("CASE WHEN {} IS NULL THEN {} END AS {}").format(packed, column, column))
+    return sql.SQL(", ").join(columns)
+
+def stored_array(row: Dict[str, Any], name: str) -> Optional[np.ndarray]:
+    """A dos_bands array from its float32 copy if stored, else from the float8 column."""
+    shapes = row.get("f32 shapes") or {}
+    buffer = row.get(f"{name} f32")
+    if buffer is not None and name in shapes:
+        return np.frombuffer(buffer, dtype="<f4").reshape(shapes[name])
+    value = row.get(name)
+    return None if value is None else np.asarray(value, dtype=float)
+
+def slice_plotinfo(
+    row: Dict[str, Any],
+    datasets: Sequence[str],
+    emin: float = -np.inf,
+    emax: float = np.inf,
+    elements: Optional[Sequence[str]] = None,
+) -> Dict[str, Any]:
+    """
+    Plot data restricted to the requested datasets, the energy window
+    [emin, emax] (eV relative to the Fermi level, like the stored energies)
+    and, for the projected DOS, the orbitals of the given elements.
+    Keys match the full get_plotinfo_from_hash response; arrays are left as
+    NumPy arrays for orjson (OPT_SERIALIZE_NUMPY) to serialize directly.
+    """
+    plotinfo: Dict[str, Any] = {"KPoints": row["KPoints"], "fermi energy": row["fermi energy"]}
+
+    for dataset, (bands_key, distances_key) in (
+        ("bands", ("bands", "band distances")),
+        ("bands_soc", ("bands soc", "band distances soc")),
+    ):
+        if dataset not in datasets:
+            continue
+        bands = stored_array(row, bands_key)
+        distances = stored_array(row, distances_key)
+        if bands is not None:
+            # (segments, bands, k-points): keep bands that enter the window anywhere
+            in_window = (bands.max(axis=(0, 2)) >= emin) & (bands.min(axis=(0, 2)) <= emax)
+            # boolean indexing on the middle axis leaves a non-C-contiguous copy, which
+            # orjson would not serialize natively (numpy_default falls back to tolist())
+            bands = np.ascontiguousarray(bands[:, in_window])
+        plotinfo[bands_key] = bands
+        plotinfo[distances_key] = distances
+
+    if "dos" in datasets or "pdos" in datasets:
+        energies = stored_array(row, "density of states energies")
+        keep = slice(None) if energies is None else (energies >= emin) & (energies <= emax)
+        plotinfo["density of states energies"] = None if energies is None else energies[keep]
+
+        if "dos" in datasets:
+            total = stored_array(row, "total density of states")
+            plotinfo["total density of states"] = None if total is None else total[keep]
+
+        if "pdos" in datasets:
+            labels = row.get("projected density of states labels")
+            if row.get("projected density of states f32") is not None:
+                pdos = stored_array(row, "projected density of states")
+            elif row.get("projected density of states") is not None:
+                pairs = row["projected density of states"]
+                labels = [label for label, _ in pairs]
+                pdos = np.asarray([values for _, values in pairs], dtype=float)
+            else:
+                pdos = None
+            if pdos is None:
+                plotinfo["projected density of states"] = None
+            else:
+                wanted = {e.lower() for e in elements or ()}
+                plotinfo["projected density of states"] = [
+                    [label, values[keep]]
+                    for label, values in zip(labels, pdos)
+                    # labels look like "Bi_s": element, then orbital; matched case-insensitively
+                    if not wanted or label.split("_")[0].lower() in wanted
+                ]
+
+    return plotinfo
@@ -0,0 +1,170 @@
+# On-demand profiling of live requests. A request sent with X-Profile: 1 and
+# the configured X-Admin-Token runs under cProfile; the statements it executed
+# (captured by timing.TimedCursorMixin) are then replayed as EXPLAIN (ANALYZE,
+# BUFFERS) in a transaction that is rolled back. The call tree (.prof, for
+# pstats/snakeviz) and a text report are written to profile_dir, and the
+# response carries the report's id in X-Profile-Id (see /admin/profiles/{id}).
+#
+# cProfile records everything the event loop thread runs, not one request. So
+# that other requests' work is not credited to the profiled one, request_gate
+# lets a profiled request start only once in-flight requests have finished and
+# holds new ones back until it is done. Background tasks (typeahead refresh,
+# pool maintenance) can still show up; work in other threads and streamed
+# response bodies are not covered.
+
+import asyncio
+import cProfile
+import hmac
+import io
+import logging
+import os
+import pstats
+import re
+import secrets
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from psycopg import sql
+from psycopg_pool import AsyncConnectionPool
+
+logger = logging.getLogger("profiling")
+
+# functions listed in the text report, by cumulative time
+REPORT_FUNCTIONS = 60
+
+PROFILE_ID = re.compile(r"^\d+-[0-9a-f]{8}$")
+
+# printed at the top of every report
+LIMITATIONS = (
+    "cProfile covers the whole event loop thread. Other requests were held back while this one ran,\n"
+    "but background tasks (typeahead refresh, pool maintenance) may appear. Threadpool work and\n"
+    "streamed response bodies (exports) are not covered.\n"
+)
+
+
+class RequestGate:
+    """Shared access for ordinary requests, exclusive access for a profiled one."""
+
+    def __init__(self) -> None:
+        self.active = 0
+        self.exclusive = False
+        self.condition = asyncio.Condition()
+
+    @asynccontextmanager
+    async def shared(self) -> AsyncIterator[None]:
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.exclusive)
+            self.active += 1
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.active -= 1
+                self.condition.notify_all()
+
+    @asynccontextmanager
+    async def alone(self) -> AsyncIterator[None]:
+        """Wait for other profiled requests and for in-flight requests to finish, then keep new ones out."""
+        async with self.condition:
+            await self.condition.wait_for(lambda: not self.exclusive)
+            self.exclusive = True
+        try:
+            # cleared below even if this wait is cancelled, or shared() would block for good
+            async with self.condition:
+                await self.condition.wait_for(lambda: self.active == 0)
+            yield
+        finally:
+            async with self.condition:
+                self.exclusive = False
+                self.condition.notify_all()
+
+
+request_gate = RequestGate()
+
+
+def is_admin(token: Optional[str], admin_token: str) -> bool:
+    """Profiling is off while admin_token is unset."""
+    return bool(admin_token) and token is not None and hmac.compare_digest(token, admin_token)
+
+
+def start_profiler() -> cProfile.Profile:
+    """Call inside request_gate.alone(), so no other request runs meanwhile."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler
+
+
+def stop_profiler(profiler: cProfile.Profile) -> None:
+    profiler.disable()
+
+
+async def explain_statements(pool: AsyncConnectionPool, statements: List[Tuple[Any, Any]]) -> List[str]:
+    """EXPLAIN (ANALYZE, BUFFERS) of each statement, in order on one connection, then rolled back."""
+    plans = []
+    if not statements:
+        return plans
+    async with pool.connection() as conn:
+        async with conn.transaction(force_rollback=True):
+            for query, params in statements:
+                if isinstance(query, str):
+                    query = sql.SQL(query)
+                text = query.as_string(conn)
+                try:
+                    async with conn.transaction():  # a failing statement must not abort the rest
+                        cur = await conn.execute(sql.SQL("EXPLAIN (ANALYZE, BUFFERS) ") + query, params)
+                        plan = "\n".join(row[0] for row in await cur.fetchall())
+                except Exception as e:
+                    plan = f"EXPLAIN failed: {e}"
+                plans.append(f"{' '.join(text.split())}\n{plan}")
+    return plans
+
+
+def profile_report(profiler: cProfile.Profile, method: str, path: str, plans: List[str]) -> str:
+    out = io.StringIO()
+    out.write(f"{method} {path}\n\n{LIMITATIONS}\n")
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(REPORT_FUNCTIONS)
+    out.write("\n-- EXPLAIN (ANALYZE, BUFFERS) of the statements executed --\n\n")
+    out.write("\n\n".join(plans) if plans else "(no statements)")
+    out.write("\n")
+    return out.getvalue()
+
+
+async def save_profile(
+    profiler: cProfile.Profile,
+    statements: List[Tuple[Any, Any]],
+    pool: AsyncConnectionPool,
+    method: str,
+    path: str,
+    directory: str,
+) -> Optional[str]:
+    """
+    Write <id>.prof and <id>.txt to directory and return the id, or None if
+    they could not be written. The request has already been served, so
+    failures are logged rather than raised.
+    """
+    try:
+        plans = await explain_statements(pool, statements)
+    except Exception as e:  # e.g. PoolTimeout while the pool is saturated
+        logger.warning("EXPLAIN of profiled %s %s failed: %s", method, path, e)
+        plans = [f"EXPLAIN failed: {e}"]
+    profile_id = f"{int(time.time())}-{secrets.token_hex(4)}"
+    try:
+        os.makedirs(directory, exist_ok=True)
+        profiler.dump_stats(os.path.join(directory, f"{profile_id}.prof"))
+        with open(os.path.join(directory, f"{profile_id}.txt"), "w") as f:
+            f.write(profile_report(profiler, method, path, plans))
+    except OSError as e:
+        logger.warning("Saving the profile of %s %s failed: %s", method, path, e)
+        return None
+    return profile_id
+
+
+def read_report(profile_id: str, directory: str) -> Optional[str]:
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        with open(os.path.join(directory, f"{profile_id}.txt")) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
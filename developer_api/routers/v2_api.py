@@ -1,19 +1,49 @@
-from typing import Any, Dict, List, Optional
-from fastapi import APIRouter, HTTPException
+import base64
+import csv
+import io
+import json
+import re
+import sys
+from array import array
+import anyio
+import numpy as np
+import orjson
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Literal, Optional, Tuple
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from pydantic import BaseModel, Field
-from psycopg.rows import class_row
+from psycopg import sql
+from psycopg.rows import class_row, dict_row
 
+from cache import ResponseCache
+from config import get_settings
 from db import get_async_pool
+from migration.composition import KNOWN_ELEMENTS, element_fractions, parse_formula
+from migration.packed import PACKED_ARRAYS
+from plotdata import DATASET_ARRAYS, FLOAT8_ARRAY_OID, Float8ArrayNumpyLoader, plot_columns, slice_plotinfo
+from timing import TimedRoute, timed
+from typeahead import typeahead_index
 
-router = APIRouter(prefix="")
+router = APIRouter(prefix="", route_class=TimedRoute)
+
+settings = get_settings()
+plot_cache = ResponseCache(settings.plot_cache_max_bytes, settings.plot_cache_ttl)
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# for lod requests answered with the full data until that level is ingested
+FALLBACK_CACHE_CONTROL = "public, max-age=300"
+facet_cache = ResponseCache(1024 * 1024, settings.facet_cache_ttl)
 
 
 class Material(BaseModel):
     id: Optional[int] = None
     search_vector: Any
     MP_ID: Optional[str] = Field(alias="MP-ID")
-    connectivity: Optional[Any]
+    connectivity: Optional[Any]  # (m, 2) bonded pairs of the 2x2x1 supercell
+    connectivity_sites: Optional[int] = Field(default=None, alias="connectivity sites")
     chemical_symbols: Optional[List[str]]
+    composition: Optional[Dict[str, float]] = None  # element -> count
+    reduced_formula: Optional[str] = Field(default=None, alias="reduced formula")
     formula: Optional[str]
     spacegroup: Optional[str]
     cell: Optional[dict]  # JSONB
@@ -68,40 +98,527 @@ class BandDOS(BaseModel):
     projected_density_of_states: Optional[List[List]] = Field(default=None, alias="projected density of states")
     fermi_energy: Optional[float] = Field(default=None, alias="fermi energy")
 
-@router.get("/get_all")
-async def get_all_data() -> list[Material]:
+class MaterialBatch(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=settings.max_page_size)
+    fields: Optional[List[str]] = None  # columns to return, default all but search_vector
+
+class PlotBatch(BaseModel):
+    hashes: List[str] = Field(min_length=1, max_length=settings.max_page_size)
+    datasets: Optional[List[Literal["bands", "bands_soc", "dos", "pdos"]]] = None
+    emin: Optional[float] = None
+    emax: Optional[float] = None
+    elements: Optional[List[str]] = None
+
+# data columns in Material order; the fast path selects exactly these
+MATERIAL_COLUMNS = [field.alias or name for name, field in Material.model_fields.items()]
+
+def edges_to_matrix(edges: List[List[int]], n: int) -> List[List[int]]:
+    matrix = [[0] * n for _ in range(n)]
+    for i, j in edges:
+        matrix[i][j] = matrix[j][i] = 1
+    return matrix
+
+def dense_connectivity(material: Material) -> Material:
+    """Expand the stored edge list into the n x n 0/1 matrix older clients expect."""
+    if material.connectivity is None or material.connectivity_sites is None:
+        return material
+    material.connectivity = edges_to_matrix(material.connectivity, material.connectivity_sites)
+    return material
+
+def dense_connectivity_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """dense_connectivity for dict rows."""
+    if row["connectivity"] is None or row["connectivity sites"] is None:
+        return row
+    row["connectivity"] = edges_to_matrix(row["connectivity"], row["connectivity sites"])
+    return row
+
+def numpy_default(value: Any) -> Any:
+    """orjson fallback for NumPy values it cannot serialize natively (scalars, non-contiguous arrays)."""
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    raise TypeError
+
+def fast_json_bytes(content: Any) -> bytes:
+    with timed("serialize"):
+        return orjson.dumps(content, default=numpy_default, option=orjson.OPT_SERIALIZE_NUMPY)
+
+def fast_json_response(content: Any) -> Response:
+    """
+    Response for the fast=true path: dict rows serialized straight to bytes,
+    skipping pydantic validation (the models still describe it in OpenAPI).
+    """
+    return Response(content=fast_json_bytes(content), media_type="application/json")
+
+def material_select() -> sql.Composable:
+    return sql.SQL(", ").join(map(sql.Identifier, MATERIAL_COLUMNS))
+
+@router.get("/get_all", deprecated=True)
+async def get_all_data(connectivity: Literal["edges", "dense"] = "edges", fast: bool = False) -> list[Material]:
+    """Every material with every column; use /materials for paged, projected listings."""
     pool = get_async_pool()
+    if fast:
+        async with (
+            pool.connection() as conn,
+            conn.cursor(row_factory=dict_row) as cur,
+        ):
+            await cur.execute(sql.SQL("SELECT {} FROM data").format(material_select()))
+            rows = await cur.fetchall()
+        if connectivity == "dense":
+            rows = [dense_connectivity_row(r) for r in rows]
+        return fast_json_response(rows)
+
     async with (
         pool.connection() as conn,
         conn.cursor(row_factory=class_row(Material)) as cur,
     ):
         await cur.execute("select * from data")
         records = await cur.fetchall()
+        if connectivity == "dense":
+            records = [dense_connectivity(r) for r in records]
         return records
 
-@router.get("/get_plotinfo_from_hash")
-async def get_plotinfo_from_hash(hash: str) -> Any:
+# data columns /materials can project, by column name and by Material field name
+LISTABLE_COLUMNS: Dict[str, str] = {}
+for name, field in Material.model_fields.items():
+    if name != "search_vector":
+        LISTABLE_COLUMNS[field.alias or name] = field.alias or name
+        LISTABLE_COLUMNS[name] = field.alias or name
+
+DEFAULT_LIST_FIELDS = ["MP-ID", "formula", "spacegroup", "band gap", "layered?", "hash"]
+
+# rows fetched from the server-side cursor per round trip when exporting
+EXPORT_CHUNK_SIZE = 500
+
+def projected_columns(fields: List[str]) -> List[str]:
+    """id plus the data columns named in fields (repeated or comma separated values)."""
+    requested = [f.strip() for value in fields for f in value.split(",") if f.strip()]
+    unknown = [f for f in requested if f not in LISTABLE_COLUMNS]
+    if unknown:
+        raise HTTPException(422, f"Unknown fields {unknown}")
+    return ["id"] + [c for c in dict.fromkeys(LISTABLE_COLUMNS[f] for f in requested) if c != "id"]
+
+@router.get("/materials")
+async def list_materials(
+    after: Optional[int] = Query(None, description="id of the last material of the previous page"),
+    limit: int = Query(100, ge=1, le=settings.max_page_size),
+    fields: Optional[List[str]] = Query(None, description="columns to return, repeated or comma separated"),
+) -> Dict[str, Any]:
+    """
+    One page of materials ordered by id. Pass the returned next_after as after
+    to get the next page; it is null on the last page. Seeking on the primary
+    key keeps every page as cheap as the first, however large the table.
+    """
+    columns = projected_columns(fields or DEFAULT_LIST_FIELDS)
+    query = sql.SQL("SELECT {} FROM data").format(sql.SQL(", ").join(map(sql.Identifier, columns)))
+    params: List[Any] = []
+    if after is not None:
+        query += sql.SQL(" WHERE id > %s")
+        params.append(after)
+    query += sql.SQL(" ORDER BY id LIMIT %s")
+    params.append(limit + 1)  # one extra row tells whether there is a next page
+
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(query, params)
+        records = await cur.fetchall()
+    items = records[:limit]
+    next_after = items[-1]["id"] if len(records) > limit else None
+    return {"items": items, "next_after": next_after}
+
+@router.post("/materials/batch")
+async def batch_materials(batch: MaterialBatch) -> Response:
+    """
+    Several materials by id in one query, for comparison views that would
+    otherwise call /{id} once per material. items follow the order of ids;
+    ids with no material are listed in missing.
+    """
+    columns = projected_columns(batch.fields or list(LISTABLE_COLUMNS.values()))
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(
+            sql.SQL("SELECT {} FROM data WHERE id = ANY(%s)").format(sql.SQL(", ").join(map(sql.Identifier, columns))),
+            (batch.ids,),
+        )
+        records = {r["id"]: r for r in await cur.fetchall()}
+    ids = list(dict.fromkeys(batch.ids))
+    return fast_json_response({
+        "items": [records[id] for id in ids if id in records],
+        "missing": [id for id in ids if id not in records],
+    })
+
+async def export_rows(columns: List[str]) -> Tuple[AsyncIterator[List[Dict[str, Any]]], Callable[[], Awaitable[None]]]:
+    """
+    Chunks of data rows from a named (server-side) cursor, so the table is
+    never held in memory. The connection is checked out, the query run and
+    the first chunk fetched before this returns, so a saturated pool (503) or
+    a database error fails the request instead of truncating a 200 stream.
+    Returns the chunks and a release() giving the connection back: the
+    iterator calls it when exhausted or closed, and the response must also
+    run it as its background task, for streams cut off or never started.
+    """
+    query = sql.SQL("SELECT {} FROM data ORDER BY id").format(sql.SQL(", ").join(map(sql.Identifier, columns)))
+    pool = get_async_pool()
+    conn = await pool.getconn()
+    released = False
+
+    async def release() -> None:
+        nonlocal released
+        if released:
+            return
+        released = True
+        # shielded: on a client disconnect the stream is cancelled, and the connection must still go back
+        with anyio.CancelScope(shield=True):
+            try:
+                await conn.rollback()  # read only; also closes the named cursor
+            finally:
+                await pool.putconn(conn)
+
+    try:
+        cur = conn.cursor(name="export", row_factory=dict_row)
+        await cur.execute(query)
+        first = await cur.fetchmany(EXPORT_CHUNK_SIZE)
+    except BaseException:
+        await release()
+        raise
+
+    async def chunks() -> AsyncIterator[List[Dict[str, Any]]]:
+        try:
+            records = first
+            while records:
+                yield records
+                records = await cur.fetchmany(EXPORT_CHUNK_SIZE)
+        finally:
+            await release()
+
+    return chunks(), release
+
+@router.get("/export.ndjson")
+async def export_ndjson(fields: Optional[List[str]] = Query(None)) -> StreamingResponse:
+    """Every material as one JSON object per line, streamed. fields= projects like /materials (default: all)."""
+    columns = projected_columns(fields or list(dict.fromkeys(LISTABLE_COLUMNS.values())))
+    chunks, release = await export_rows(columns)
+
+    async def lines() -> AsyncIterator[bytes]:
+        async for records in chunks:
+            yield "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode()
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
+@router.get("/export.csv")
+async def export_csv(fields: Optional[List[str]] = Query(None)) -> StreamingResponse:
+    """Every material as CSV, streamed. Array and JSONB columns are written as JSON."""
+    columns = projected_columns(fields or list(dict.fromkeys(LISTABLE_COLUMNS.values())))
+    chunks, release = await export_rows(columns)
+
+    async def lines() -> AsyncIterator[bytes]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        async for records in chunks:
+            for record in records:
+                writer.writerow(
+                    json.dumps(value) if isinstance(value, (list, dict)) else value
+                    for value in record.values()
+                )
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+
+    return StreamingResponse(lines(), media_type="text/csv", background=BackgroundTask(release))
+
+def json_bytes(content: Any) -> bytes:
+    """Serialize like FastAPI's JSONResponse, for bodies that are cached as bytes."""
+    with timed("serialize"):
+        return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """If-None-Match uses the weak comparison, so W/ prefixes are ignored."""
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def unpack_float32(buffer: bytes, shape: List[int]) -> list:
+    """Nested lists from a little-endian float32 buffer of the given shape."""
+    values = array("f", buffer)
+    if sys.byteorder == "big":
+        values.byteswap()
+    nested: list = values.tolist()
+    for size in reversed(shape[1:]):
+        nested = [nested[i:i + size] for i in range(0, len(nested), size)]
+    return nested
+
+def fill_from_float32(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Fill arrays that were only stored as float32 from their "<name> f32" columns."""
+    shapes = row.get("f32 shapes") or {}
+    for name in PACKED_ARRAYS:
+        buffer = row.get(f"{name} f32")
+        if row.get(name) is not None or buffer is None or name not in shapes:
+            continue
+        values = unpack_float32(buffer, shapes[name])
+        if name == "projected density of states":
+            values = [list(pair) for pair in zip(row["projected density of states labels"], values)]
+        row[name] = values
+    return row
+
+def check_energy_window(emin: Optional[float], emax: Optional[float]) -> None:
+    if emin is not None and emax is not None and emin > emax:
+        raise HTTPException(422, "emin must not be greater than emax")
+
+async def load_sliced_plotinfo(
+    hash: str,
+    datasets: List[str],
+    emin: Optional[float],
+    emax: Optional[float],
+    elements: Optional[List[str]],
+) -> Optional[bytes]:
+    """Sliced plot data (see plotdata.slice_plotinfo) as JSON, read as NumPy arrays end to end."""
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row, binary=True) as cur,
+    ):
+        cur.adapters.register_loader(FLOAT8_ARRAY_OID, Float8ArrayNumpyLoader)
+        await cur.execute(
+            sql.SQL("SELECT {} FROM dos_bands WHERE hash = %s;").format(plot_columns(datasets)),
+            (hash,),
+        )
+        record = await cur.fetchone()
+    if record is None:
+        return None
+    plotinfo = slice_plotinfo(
+        record,
+        datasets,
+        emin if emin is not None else float("-inf"),
+        emax if emax is not None else float("inf"),
+        elements,
+    )
+    return fast_json_bytes(plotinfo)
+
+async def load_plotinfo(
+    hash: str,
+    format: str,
+    dataset: Optional[str],
+    lod: int,
+    datasets: Optional[List[str]],
+    emin: Optional[float],
+    emax: Optional[float],
+    elements: Optional[List[str]],
+    fast: bool = False,
+) -> Optional[Tuple[bytes, str, Dict[str, str]]]:
+    """Serialized get_plotinfo_from_hash body as (body, media type, extra headers), None if not found."""
+    pool = get_async_pool()
+    check_energy_window(emin, emax)
+    if datasets or emin is not None or emax is not None or elements:
+        if format != "json" or lod > 0:
+            raise HTTPException(422, "datasets/emin/emax/elements are only available with format=json and lod=0")
+        body = await load_sliced_plotinfo(hash, datasets or list(DATASET_ARRAYS), emin, emax, elements)
+        return None if body is None else (body, "application/json", {})
+
+    if lod > 0:
+        if format != "json":
+            raise HTTPException(422, "lod is only available with format=json")
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                "SELECT plotinfo::text FROM dos_bands_lod WHERE hash = %s AND lod = %s;",
+                (hash, lod),
+            )
+            row = await cur.fetchone()
+        if row is not None:
+            # stored as JSON already, no need to build Python lists
+            return row[0].encode(), "application/json", {"X-LOD": str(lod)}
+        # level not computed (yet): serve the full data, and say so
+        loaded = await load_plotinfo(hash, format, dataset, 0, datasets, emin, emax, elements, fast)
+        return None if loaded is None else (loaded[0], loaded[1], {**loaded[2], "X-LOD": "0"})
+
+    if format == "json" and fast:
+        body = await load_sliced_plotinfo(hash, list(DATASET_ARRAYS), None, None, None)
+        return None if body is None else (body, "application/json", {})
+
+    if format == "json":
+        async with (
+            pool.connection() as conn,
+            conn.cursor(row_factory=dict_row) as cur,
+        ):
+            await cur.execute("SELECT * FROM dos_bands WHERE hash = %s;", (hash,))
+            record = await cur.fetchone()
+        if record is None:
+            return None
+        band_dos = BandDOS.model_validate(fill_from_float32(record))
+        with timed("serialize"):
+            return band_dos.model_dump_json(by_alias=True).encode(), "application/json", {}
+
+    if format == "binary" and dataset not in PACKED_ARRAYS:
+        raise HTTPException(422, f"dataset must be one of {PACKED_ARRAYS}")
+    names = [dataset] if format == "binary" else PACKED_ARRAYS
+    columns = sql.SQL(", ").join(sql.Identifier(f"{name} f32") for name in names)
+
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(
+            sql.SQL(
+                """
+                SELECT "KPoints", "fermi energy", "projected density of states labels", "f32 shapes", {}
+                FROM dos_bands WHERE hash = %s;
+                """
+            ).format(columns),
+            (hash,),
+        )
+        record = await cur.fetchone()
+    if record is None:
+        raise HTTPException(404)
+    shapes = record["f32 shapes"] or {}
+    if not any(name in shapes for name in names):
+        raise HTTPException(404, "No float32 data stored for this material")
+
+    if format == "binary":
+        headers = {"X-Array-Shape": ",".join(map(str, shapes[dataset])), "X-Array-Dtype": "<f4"}
+        return bytes(record[f"{dataset} f32"]), "application/octet-stream", headers
+
+    return json_bytes({
+        "KPoints": record["KPoints"],
+        "fermi energy": record["fermi energy"],
+        "projected density of states labels": record["projected density of states labels"],
+        "arrays": {
+            name: {
+                "dtype": "<f4",
+                "shape": shapes[name],
+                "data": base64.b64encode(record[f"{name} f32"]).decode("ascii"),
+            }
+            for name in names
+            if name in shapes
+        },
+    }), "application/json", {}
+
+@router.get("/get_plotinfo_from_hash", responses={200: {"model": BandDOS}})
+async def get_plotinfo_from_hash(
+    request: Request,
+    hash: str,
+    format: Literal["json", "base64", "binary"] = "json",
+    dataset: Optional[str] = None,
+    lod: int = Query(0, ge=0),
+    datasets: Optional[List[Literal["bands", "bands_soc", "dos", "pdos"]]] = Query(None),
+    emin: Optional[float] = None,
+    emax: Optional[float] = None,
+    elements: Optional[List[str]] = Query(None),
+    fast: bool = False,
+) -> Any:
     """
     Provided a hash of a material, grab the dos and bands from the separate table.
+
+    lod > 0 returns the downsampled plot data precomputed at ingest (see
+    migration/lod.py; higher is coarser, 3 is sized for card previews), or the
+    full data if that level was not computed. X-LOD reports the level served.
+
+    format=base64 returns the float32 buffers as base64 with their shapes, and
+    format=binary returns the raw little-endian float32 buffer of one array
+    (dataset=...), with its shape in the X-Array-Shape header. Both need the
+    material to have been ingested with --storage float32 or both.
+
+    datasets (repeatable: bands, bands_soc, dos, pdos), emin/emax (eV relative
+    to the Fermi level, emin <= emax) and elements (repeatable, case-insensitive,
+    PDOS orbitals to keep) slice the full data on the server; only the requested
+    columns are read.
+
+    fast=true skips the BandDOS model and serializes the arrays from NumPy
+    with orjson (float32 storage is then written at float32 precision).
+
+    The data for a hash never changes, so serialized responses are kept in
+    plot_cache and sent with a strong ETag and Cache-Control: immutable. The
+    full-data fallback for a missing level is the exception: it changes once
+    the level is ingested, so it is neither cached here nor marked immutable.
     """
     if not hash:
         return {"message": "No hash provided"}
 
+    key = (
+        hash, format, dataset, lod, tuple(datasets or ()), emin, emax, tuple(elements or ()), fast,
+    )
+    cached = plot_cache.get(key)
+    status = "HIT"
+    if cached is None:
+        status = "MISS"
+        loaded = await load_plotinfo(hash, format, dataset, lod, datasets, emin, emax, elements, fast)
+        if loaded is None:
+            return None
+        if loaded[2].get("X-LOD", str(lod)) == str(lod):
+            cached = plot_cache.put(key, *loaded)
+        else:
+            cached = plot_cache.entry(*loaded)
+
+    served_requested_level = cached.headers.get("X-LOD", str(lod)) == str(lod)
+    headers = {
+        **cached.headers,
+        "ETag": cached.etag,
+        "Cache-Control": IMMUTABLE_CACHE_CONTROL if served_requested_level else FALLBACK_CACHE_CONTROL,
+        "X-Cache": status,
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type=cached.media_type, headers=headers)
+
+@router.post("/plotinfo/batch")
+async def batch_plotinfo(batch: PlotBatch) -> Response:
+    """
+    Sliced plot data (as get_plotinfo_from_hash with datasets/emin/emax/elements)
+    for several hashes in one query, keyed by hash. Hashes with no plot data are
+    listed in missing.
+    """
+    check_energy_window(batch.emin, batch.emax)
+    datasets = batch.datasets or list(DATASET_ARRAYS)
     pool = get_async_pool()
     async with (
         pool.connection() as conn,
-        conn.cursor(row_factory=class_row(BandDOS)) as cur,
+        conn.cursor(row_factory=dict_row, binary=True) as cur,
     ):
-        await cur.execute("SELECT * FROM dos_bands WHERE hash = %s;", (hash,))
-        records = await cur.fetchone()
-        return records
+        cur.adapters.register_loader(FLOAT8_ARRAY_OID, Float8ArrayNumpyLoader)
+        await cur.execute(
+            sql.SQL("SELECT hash, {} FROM dos_bands WHERE hash = ANY(%s);").format(plot_columns(datasets)),
+            (batch.hashes,),
+        )
+        records = {r["hash"]: r for r in await cur.fetchall()}
+    emin = batch.emin if batch.emin is not None else float("-inf")
+    emax = batch.emax if batch.emax is not None else float("inf")
+    hashes = list(dict.fromkeys(batch.hashes))
+    return fast_json_response({
+        "items": {
+            hash: slice_plotinfo(records[hash], datasets, emin, emax, batch.elements)
+            for hash in hashes if hash in records
+        },
+        "missing": [hash for hash in hashes if hash not in records],
+    })
 
-@router.get("/query")
-async def get_by_formula(formula: Optional[str] = None) -> Any:
+@router.get("/plot_cache")
+async def plot_cache_stats() -> Dict[str, int]:
+    """Size and hit/miss/eviction counters of the plot data cache."""
+    return plot_cache.stats()
+
+@router.get("/query", responses={200: {"model": List[Material]}})
+async def get_by_formula(formula: Optional[str] = None, fast: bool = False) -> Any:
     pool = get_async_pool()
     if not formula:
         return {"message": "No search query provided."}
 
+    if fast:
+        async with (
+            pool.connection() as conn,
+            conn.cursor(row_factory=dict_row) as cur,
+        ):
+            await cur.execute(
+                sql.SQL("SELECT {} FROM data WHERE formula ILIKE %s").format(material_select()),
+                [f"%{formula}%"],
+            )
+            rows = await cur.fetchall()
+        if not rows:
+            return {"message": "No materials found matching the query."}
+        return fast_json_response(rows)
+
     async with (
         pool.connection() as conn,
         conn.cursor(row_factory=class_row(Material)) as cur,
@@ -115,55 +632,545 @@ async def get_by_formula(formula: Optional[str] = None) -> Any:
         return records
 
 
-@router.get("/search_contains")
-async def search_contains(query: str, limit: int = 20) -> Any:
-    """Substring search --- good for searching formula or text-based parameters. Just does many ILIKE checks, nothing fancy."""
+@router.get("/search_contains", responses={200: {"model": List[Material]}})
+async def search_contains(
+    query: str,
+    limit: int = 20,
+    fast: bool = False,
+    mode: Literal["substring", "similarity"] = "substring",
+    threshold: float = Query(0.3, gt=0, le=1),
+) -> Any:
+    """
+    Substring search --- good for searching formula or text-based parameters. Just does many ILIKE checks, nothing fancy.
+
+    mode=similarity is typo tolerant instead ("Bi2Te", "mp-2822"): rows whose
+    formula, MP-ID or spacegroup has a word_similarity to query above threshold,
+    best match first. It uses the trigram indexes on those three columns.
+    """
 
     pool = get_async_pool()
     async with (
         pool.connection() as conn,
-        conn.cursor(row_factory=class_row(Material)) as cur,
+        conn.cursor(row_factory=dict_row if fast else class_row(Material)) as cur,
+    ):
+        if mode == "similarity":
+            # <% only uses the trigram indexes with the threshold set as a GUC, not as a literal
+            await cur.execute("SELECT set_config('pg_trgm.word_similarity_threshold', %s, true)", [str(threshold)])
+            await cur.execute(
+                sql.SQL("""
+                SELECT {},
+                       GREATEST(
+                           word_similarity(%(query)s, formula),
+                           word_similarity(%(query)s, "MP-ID"),
+                           word_similarity(%(query)s, spacegroup)
+                       ) AS relevance_score
+                FROM data
+                WHERE %(query)s <%% formula
+                   OR %(query)s <%% "MP-ID"
+                   OR %(query)s <%% spacegroup
+                ORDER BY relevance_score DESC, formula
+                LIMIT %(limit)s
+                """).format(material_select() if fast else sql.SQL("*")),
+                {"query": query, "limit": limit},
+            )
+        else:
+            await cur.execute(
+                sql.SQL("""
+                SELECT {},
+                       CASE 
+                           WHEN formula = %s THEN 100
+                           WHEN formula ILIKE %s THEN 100
+                           WHEN "MP-ID" = %s THEN 90
+                           WHEN "MP-ID" ILIKE %s THEN 70
+                           WHEN "spacegroup" = %s THEN 100
+                           WHEN "spacegroup" ILIKE %s THEN 70
+                           ELSE 50
+                       END as relevance_score
+                FROM data 
+                WHERE formula ILIKE %s 
+                   OR "MP-ID" ILIKE %s
+                   OR "spacegroup" ILIKE %s
+                ORDER BY relevance_score DESC, formula
+                LIMIT %s
+            """).format(material_select() if fast else sql.SQL("*")),
+                [
+                    query,
+                    query,
+                    query,
+                    query,
+                    query,
+                    query,  # relevance scoring
+                    f"%{query}%",
+                    f"%{query}%",
+                    f"%{query}%",  # where conditions
+                    limit,
+                ],
+            )
+
+        records = await cur.fetchall()
+        if fast:
+            for record in records:
+                del record["relevance_score"]
+            return fast_json_response(records)
+        return records
+
+
+def parse_bounds(bounds: Optional[List[str]]) -> List[Tuple[str, float]]:
+    """[("Te", 0.5)] from ["Te:0.5"], [("band gap", 1.0)] from ["band gap:1"]."""
+    parsed = []
+    for bound in bounds or []:
+        name, _, value = bound.rpartition(":")
+        try:
+            parsed.append((name.strip(), float(value)))
+        except ValueError:
+            raise HTTPException(422, f"Expected name:value, got {bound!r}")
+    return parsed
+
+@router.get("/composition")
+async def composition_range(
+    min_fraction: Optional[List[str]] = Query(None, description="element:fraction lower bounds, e.g. Te:0.5"),
+    max_fraction: Optional[List[str]] = Query(None, description="element:fraction upper bounds, e.g. Bi:0.2"),
+    fields: Optional[List[str]] = Query(None),
+    after: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=settings.max_page_size),
+) -> Dict[str, Any]:
+    """
+    Materials whose element fractions (atoms of the element / all atoms) lie
+    within the given bounds. A min_fraction term requires the element to be
+    present, so Te:0 means "contains Te"; a max_fraction term also matches
+    materials without the element. Each bound is a range scan on the
+    (element, fraction) index of material_elements. Paged by id like /materials.
+    """
+    lower = [(element.capitalize(), fraction) for element, fraction in parse_bounds(min_fraction)]
+    upper = [(element.capitalize(), fraction) for element, fraction in parse_bounds(max_fraction)]
+    if not lower and not upper:
+        raise HTTPException(422, "Give at least one min_fraction or max_fraction")
+    for element, fraction in lower + upper:
+        if not 0 <= fraction <= 1:
+            raise HTTPException(422, f"Fraction of {element} must be between 0 and 1, got {fraction}")
+    columns = projected_columns(fields or DEFAULT_LIST_FIELDS + ["composition"])
+
+    conditions = []
+    params: List[Any] = []
+    for element, fraction in lower:
+        conditions.append(sql.SQL(
+            "EXISTS (SELECT 1 FROM material_elements e WHERE e.id = data.id AND e.element = %s AND e.fraction >= %s)"
+        ))
+        params += [element, fraction]
+    for element, fraction in upper:
+        conditions.append(sql.SQL(
+            "NOT EXISTS (SELECT 1 FROM material_elements e WHERE e.id = data.id AND e.element = %s AND e.fraction > %s)"
+        ))
+        params += [element, fraction]
+    if after is not None:
+        conditions.append(sql.SQL("id > %s"))
+        params.append(after)
+    params.append(limit + 1)
+
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
     ):
         await cur.execute(
-            """
-            SELECT *,
-                   CASE 
-                       WHEN formula = %s THEN 100
-                       WHEN formula ILIKE %s THEN 100
-                       WHEN "MP-ID" = %s THEN 90
-                       WHEN "MP-ID" ILIKE %s THEN 70
-                       WHEN "spacegroup" = %s THEN 100
-                       WHEN "spacegroup" ILIKE %s THEN 70
-                       ELSE 50
-                   END as relevance_score
-            FROM data 
-            WHERE formula ILIKE %s 
-               OR "MP-ID" ILIKE %s
-               OR "spacegroup" ILIKE %s
-            ORDER BY relevance_score DESC, formula
-            LIMIT %s
-        """,
-            [
-                query,
-                query,
-                query,
-                query,
-                query,
-                query,  # relevance scoring
-                f"%{query}%",
-                f"%{query}%",
-                f"%{query}%",  # where conditions
-                limit,
-            ],
+            sql.SQL("SELECT {} FROM data WHERE {} ORDER BY id LIMIT %s").format(
+                sql.SQL(", ").join(map(sql.Identifier, columns)),
+                sql.SQL(" AND ").join(conditions),
+            ),
+            params,
         )
+        records = await cur.fetchall()
+    items = records[:limit]
+    next_after = items[-1]["id"] if len(records) > limit else None
+    return {"items": items, "next_after": next_after}
+
+@router.get("/nearest_composition")
+async def nearest_composition(
+    formula: str,
+    fields: Optional[List[str]] = Query(None),
+    limit: int = Query(10, ge=1, le=100),
+) -> Dict[str, Any]:
+    """
+    Materials closest in composition to formula, by L1 distance between
+    element-fraction vectors (0: same stoichiometry, 2: no element in common).
+    Only materials sharing an element are candidates, found through the
+    material_elements index.
+    """
+    try:
+        fractions = element_fractions(parse_formula(formula))
+    except ValueError as e:
+        raise HTTPException(422, str(e))
+    columns = projected_columns(fields or DEFAULT_LIST_FIELDS + ["reduced formula"])
 
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        # with fractions summing to 1 on both sides, sum |a - b| = 2 - 2 * sum min(a, b)
+        await cur.execute(
+            sql.SQL(
+                """
+                SELECT {}, 2 - 2 * nearest.shared AS distance
+                FROM (
+                    SELECT e.id, sum(least(e.fraction, q.fraction)) AS shared
+                    FROM material_elements e
+                    JOIN unnest(%s::text[], %s::double precision[]) AS q(element, fraction) USING (element)
+                    GROUP BY e.id
+                    ORDER BY shared DESC, e.id
+                    LIMIT %s
+                ) AS nearest
+                JOIN data USING (id)
+                ORDER BY distance, id;
+                """
+            ).format(sql.SQL(", ").join(sql.Identifier("data", c) for c in columns)),
+            [list(fractions), list(fractions.values()), limit],
+        )
         records = await cur.fetchall()
-        return records
+    return {"query": {"formula": formula, "fractions": fractions}, "items": records}
+
+# float columns /filter can bound and sort on, by column name and by Material field name
+FILTERABLE_COLUMNS: Dict[str, str] = {
+    key: field.alias or name
+    for name, field in Material.model_fields.items()
+    if field.annotation == Optional[float]
+    for key in (name, field.alias or name)
+}
+
+def filterable_column(name: str) -> str:
+    if name not in FILTERABLE_COLUMNS:
+        raise HTTPException(422, f"Cannot filter on {name!r}; use one of {sorted(set(FILTERABLE_COLUMNS.values()))}")
+    return FILTERABLE_COLUMNS[name]
+
+def numeric_conditions(
+    min: Optional[List[str]],
+    max: Optional[List[str]],
+    layered: Optional[bool],
+) -> Tuple[List[sql.Composable], List[Any], List[str]]:
+    """WHERE conditions and parameters for /filter style bounds, plus the bounded columns."""
+    conditions: List[sql.Composable] = []
+    params: List[Any] = []
+    bounded = []
+    for bounds, operator in ((min, ">="), (max, "<=")):
+        for name, value in parse_bounds(bounds):
+            column = filterable_column(name)
+            conditions.append(sql.SQL("{} " + operator + " %s").format(sql.Identifier(column)))
+            params.append(value)
+            bounded.append(column)
+    if layered is not None:
+        conditions.append(sql.SQL('"layered?" = %s'))
+        params.append(layered)
+    return conditions, params, bounded
+
+@router.get("/filter")
+async def filter_materials(
+    min: Optional[List[str]] = Query(None, description="column:value lower bounds, e.g. band gap:0.5"),
+    max: Optional[List[str]] = Query(None, description="column:value upper bounds, e.g. band gap:1.5"),
+    layered: Optional[bool] = None,
+    sort: str = "id",
+    order: Literal["asc", "desc"] = "asc",
+    fields: Optional[List[str]] = Query(None),
+    limit: int = Query(100, ge=1, le=settings.max_page_size),
+) -> Dict[str, Any]:
+    """
+    Screen materials on numeric properties: every bound must hold (rows where
+    the property is unknown never match a bound), optionally only layered or
+    non-layered materials, sorted on id or any filterable column (unknown
+    values last). Bounded columns are returned along with fields.
+    """
+    conditions, params, bounded = numeric_conditions(min, max, layered)
+    if sort != "id" and sort not in FILTERABLE_COLUMNS:
+        raise HTTPException(422, f"Cannot sort on {sort!r}")
+    sort_column = "id" if sort == "id" else FILTERABLE_COLUMNS[sort]
+    columns = projected_columns((fields or DEFAULT_LIST_FIELDS) + bounded + ([sort_column] if sort != "id" else []))
+    params.append(limit)
+
+    query = sql.SQL("SELECT {} FROM data").format(sql.SQL(", ").join(map(sql.Identifier, columns)))
+    if conditions:
+        query += sql.SQL(" WHERE ") + sql.SQL(" AND ").join(conditions)
+    query += sql.SQL(" ORDER BY {} " + order.upper() + " NULLS LAST, id LIMIT %s").format(sql.Identifier(sort_column))
+
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        await cur.execute(query, params)
+        records = await cur.fetchall()
+    return {"items": records}
+
+@router.get("/top")
+async def top_materials(
+    by: str,
+    order: Literal["desc", "asc"] = "desc",
+    k: int = Query(20, ge=1, le=settings.max_page_size),
+    min: Optional[List[str]] = Query(None, description="column:value lower bounds, as in /filter"),
+    max: Optional[List[str]] = Query(None, description="column:value upper bounds, as in /filter"),
+    layered: Optional[bool] = None,
+    fields: Optional[List[str]] = Query(None),
+) -> Dict[str, Any]:
+    """
+    The k materials with the largest (order=desc) or smallest (order=asc)
+    value of a numeric property, e.g. by=dielectric constant Z&layered=true.
+    Materials without a value are skipped, so on an indexed column Postgres
+    reads the index in order and stops after k matches.
+    """
+    column = filterable_column(by)
+    conditions, params, bounded = numeric_conditions(min, max, layered)
+    conditions.insert(0, sql.SQL("{} IS NOT NULL").format(sql.Identifier(column)))
+    columns = projected_columns((fields or DEFAULT_LIST_FIELDS) + [column] + bounded)
+    params.append(k)
+
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row) as cur,
+    ):
+        # ordering without NULLS LAST matches a plain B-tree (forward or backward)
+        await cur.execute(
+            sql.SQL("SELECT {} FROM data WHERE {} ORDER BY {} " + order.upper() + ", id LIMIT %s").format(
+                sql.SQL(", ").join(map(sql.Identifier, columns)),
+                sql.SQL(" AND ").join(conditions),
+                sql.Identifier(column),
+            ),
+            params,
+        )
+        records = await cur.fetchall()
+    return {"by": column, "order": order, "items": records}
+
+SYMBOLS_BY_LOWER = {e.lower(): e for e in KNOWN_ELEMENTS}
+
+def element_readings(token: str) -> List[List[str]]:
+    """Every way to split token into element symbols, ignoring case: "bite" -> [[Bi, Te], [B, I, Te]]."""
+    if not token:
+        return [[]]
+    readings = []
+    for size in (1, 2):
+        symbol = SYMBOLS_BY_LOWER.get(token[:size].lower())
+        if symbol and len(token) >= size:
+            readings += [[symbol] + rest for rest in element_readings(token[size:])]
+    return readings
+
+def parse_elements(symbols: str) -> List[str]:
+    """
+    Lowercase element symbols from "Bi,Te", "Bi Te" or "BiTe", as stored in
+    chemical_symbols. A separated token that is one symbol in any case ("bi",
+    "TE") is read as that symbol; capitalization splits run-together symbols.
+    Unknown symbols, and input with several readings ("BI" is Bi or B, I), are a 422.
+    """
+    elements = []
+    for token in re.findall(r"[A-Za-z]+", symbols):
+        if len(token) <= 2 and token[1:] == token[1:].lower() and token.lower() in SYMBOLS_BY_LOWER:
+            elements.append(token.lower())
+            continue
+        if token != token.upper() and token != token.lower():
+            # mixed case: capitals mark where symbols start
+            parts = re.findall(r"[A-Z][a-z]?", token)
+            if "".join(parts) != token or any(p not in KNOWN_ELEMENTS for p in parts):
+                raise HTTPException(422, f"{token!r} is not made of element symbols")
+            elements += [p.lower() for p in parts]
+            continue
+        readings = element_readings(token)
+        if not readings:
+            raise HTTPException(422, f"{token!r} is not made of element symbols")
+        if len(readings) > 1:
+            options = " or ".join(", ".join(reading) for reading in readings)
+            raise HTTPException(422, f"{token!r} is ambiguous ({options}); capitalize the symbols or separate them")
+        elements += [e.lower() for e in readings[0]]
+    if not elements:
+        raise HTTPException(422, "No element symbols given")
+    return list(dict.fromkeys(elements))
 
+@router.get("/elements", responses={200: {"model": List[Material]}})
+async def search_elements(
+    symbols: str,
+    match: Literal["all", "any", "exactly"] = "all",
+    limit: int = Query(100, ge=1, le=settings.max_page_size),
+    fast: bool = False,
+) -> Any:
+    """
+    Materials by composition: containing all of the given elements, any of
+    them, or exactly that set and nothing else (e.g. symbols=Ge,Sb,Te&match=exactly).
+    Array containment on chemical_symbols, answered from its GIN index.
+    """
+    condition = {
+        "all": "chemical_symbols @> %(elements)s",
+        "any": "chemical_symbols && %(elements)s",
+        "exactly": "chemical_symbols @> %(elements)s AND chemical_symbols <@ %(elements)s",
+    }[match]
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row if fast else class_row(Material)) as cur,
+    ):
+        await cur.execute(
+            sql.SQL("SELECT {} FROM data WHERE " + condition + " ORDER BY id LIMIT %(limit)s").format(
+                material_select() if fast else sql.SQL("*")
+            ),
+            {"elements": parse_elements(symbols), "limit": limit},
+        )
+        records = await cur.fetchall()
+    return fast_json_response(records) if fast else records
+
+@router.get("/suggest")
+async def suggest(q: str, limit: int = Query(10, ge=1, le=50)) -> List[Dict[str, Any]]:
+    """
+    Autocomplete for the search box: formulas, MP-IDs and spacegroups starting
+    with q (case-insensitive; MP-IDs and spacegroups also by their number).
+    Served from the in-memory typeahead index, no database round trip.
+    """
+    return [
+        {"value": s.value, "field": s.field, "count": len(s.ids), "ids": list(s.ids[:10])}
+        for s in typeahead_index.suggest(q, limit)
+    ]
+
+def group_facets(rows: List[Tuple[str, str, Optional[float], Optional[float], int]]) -> Dict[str, Any]:
+    """Shape material_facets rows for /facets, histogram bins in order."""
+    facets: Dict[str, Any] = {"total": 0, "elements": {}, "spacegroups": {}, "layered": {}, "histograms": {}}
+    for facet, value, lower, upper, count in rows:
+        if facet == "total":
+            facets["total"] = count
+        elif facet == "element":
+            facets["elements"][value] = count
+        elif facet == "spacegroup":
+            facets["spacegroups"][value] = count
+        elif facet == "layered":
+            facets["layered"][value] = count
+        else:
+            facets["histograms"].setdefault(facet, []).append(
+                {"bin": int(value), "lower": lower, "upper": upper, "count": count}
+            )
+    for bins in facets["histograms"].values():
+        bins.sort(key=lambda b: b["bin"])
+    return facets
+
+@router.get("/facets")
+async def facets(request: Request) -> Any:
+    """
+    Counts for the filter sidebar: materials per element, spacegroup and
+    layered?, and 20-bin histograms of the band gaps, exfoliation energy,
+    vdW gap and cohesive energy (empty bins are left out).
+
+    Read from the material_facets materialized view, which the populate script
+    refreshes after ingesting; the serialized response is kept in memory for
+    facet_cache_ttl seconds and sent with an ETag.
+    """
+    cached = facet_cache.get("facets")
+    status = "HIT"
+    if cached is None:
+        status = "MISS"
+        async with get_async_pool().connection() as conn:
+            cur = await conn.execute("SELECT facet, value, lower, upper, count FROM material_facets ORDER BY count DESC, value;")
+            rows = await cur.fetchall()
+        cached = facet_cache.put("facets", fast_json_bytes(group_facets(rows)), "application/json")
+
+    headers = {
+        "ETag": cached.etag,
+        "Cache-Control": f"public, max-age={int(settings.facet_cache_ttl)}",
+        "X-Cache": status,
+    }
+    if etag_matches(request.headers.get("if-none-match", ""), cached.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type=cached.media_type, headers=headers)
+
+def prefix_tsquery(query: str) -> str:
+    """
+    to_tsquery text matching the words of query as prefixes, for partly typed
+    terms like "mp-28" or "Bi2". Keeps the websearch meaning of -word and or.
+    """
+    terms = []
+    for word in query.replace('"', " ").split():
+        if word.lower() == "or":
+            if terms and terms[-1] != "|":
+                terms.append("|")
+            continue
+        negate = word.startswith("-") and len(word) > 1
+        tokens = re.findall(r"-?\w+", word[1:] if negate else word)
+        if not tokens:
+            continue
+        term = " & ".join(f"'{token}':*" for token in tokens)
+        if terms and terms[-1] != "|":
+            terms.append("&")
+        terms.append(f"!({term})" if negate else f"({term})")
+    if terms and terms[-1] == "|":
+        terms.pop()
+    return " ".join(terms)
+
+@router.get("/search", responses={200: {"model": List[Material]}})
+async def search(
+    response: Response,
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    fast: bool = False,
+) -> Any:
+    """
+    Full-text search on the weighted search_vector (MP-ID > formula, spacegroup
+    > symbols), ranked by ts_rank_cd. q takes web search syntax ("quoted
+    phrases", or, -exclusions) and its words also match as prefixes. When
+    nothing matches, falls back to trigram similarity on formula. Both use
+    GIN indexes. The mode used is returned in the X-Search-Mode header.
+    """
+    columns = material_select() if fast else sql.SQL("*")
+    pool = get_async_pool()
+    async with (
+        pool.connection() as conn,
+        conn.cursor(row_factory=dict_row if fast else class_row(Material)) as cur,
+    ):
+        await cur.execute(
+            sql.SQL(
+                """
+                SELECT {}, ts_rank_cd(search_vector, query) AS rank
+                FROM data,
+                     (SELECT websearch_to_tsquery('english', %(q)s) || to_tsquery('english', %(prefix)s) AS query) AS q
+                WHERE search_vector @@ query
+                ORDER BY rank DESC, id
+                LIMIT %(limit)s
+                """
+            ).format(columns),
+            {"q": q, "prefix": prefix_tsquery(q), "limit": limit},
+        )
+        records = await cur.fetchall()
+        mode = "fulltext"
+        if not records:
+            # misspelt formulas have no lexeme to match, but are close in trigrams
+            await cur.execute(
+                sql.SQL(
+                    """
+                    SELECT {}, similarity(formula, %(q)s) AS rank
+                    FROM data
+                    WHERE formula %% %(q)s
+                    ORDER BY rank DESC, id
+                    LIMIT %(limit)s
+                    """
+                ).format(columns),
+                {"q": q, "limit": limit},
+            )
+            records = await cur.fetchall()
+            mode = "trigram"
+
+    if fast:
+        for record in records:
+            del record["rank"]
+        response = fast_json_response(records)
+    response.headers["X-Search-Mode"] = mode
+    return response if fast else records
 
 @router.get("/{id}")
-async def get(id: int) -> Material:
+async def get(id: int, connectivity: Literal["edges", "dense"] = "edges", fast: bool = False) -> Material:
     pool = get_async_pool()
+    if fast:
+        async with (
+            pool.connection() as conn,
+            conn.cursor(row_factory=dict_row) as cur,
+        ):
+            await cur.execute(sql.SQL("SELECT {} FROM data WHERE id = %s").format(material_select()), [id])
+            row = await cur.fetchone()
+        if not row:
+            raise HTTPException(404)
+        if connectivity == "dense":
+            row = dense_connectivity_row(row)
+        return fast_json_response(row)
+
     async with (
         pool.connection() as conn,
         conn.cursor(row_factory=class_row(Material)) as cur,
@@ -172,6 +1179,8 @@ async def get(id: int) -> Material:
         record = await cur.fetchone()
         if not record:
             raise HTTPException(404)
+        if connectivity == "dense":
+            record = dense_connectivity(record)
         return record
 
 
@@ -0,0 +1,37 @@
+# Runs against the database in the DB_* settings; skipped when it is not reachable.
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+
+@pytest.fixture(scope="module")
+def client():
+    try:
+        with TestClient(app) as client:
+            client.get("/api/materials", params={"limit": 1}).raise_for_status()
+            yield client
+    except Exception as e:
+        pytest.skip(f"database not available: {e}")
+
+
+def ids(client, **params):
+    response = client.get("/api/composition", params={**params, "fields": "formula", "limit": 500})
+    response.raise_for_status()
+    return {item["id"] for item in response.json()["items"]}
+
+
+def test_min_fraction_zero_requires_the_element(client):
+    containing = {m["id"] for m in client.get("/api/elements", params={"symbols": "Te", "match": "any", "limit": 500}).json()}
+    assert ids(client, min_fraction="Te:0") == containing
+
+
+def test_max_fraction_matches_materials_without_the_element(client):
+    everything = {m["id"] for m in client.get("/api/materials", params={"limit": 500}).json()["items"]}
+    assert ids(client, max_fraction="Te:0") == everything - ids(client, min_fraction="Te:0")
+
+
+@pytest.mark.parametrize("bound", ["min_fraction", "max_fraction"])
+def test_fraction_out_of_range_is_rejected(client, bound):
+    assert client.get("/api/composition", params={bound: "Te:-0.1"}).status_code == 422
+    assert client.get("/api/composition", params={bound: "Te:1.5"}).status_code == 422
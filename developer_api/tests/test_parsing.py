@@ -0,0 +1,27 @@
+import pytest
+from fastapi import HTTPException
+
+from routers.v2_api import parse_elements
+
+
+@pytest.mark.parametrize(
+    "symbols, expected",
+    [
+        ("Bi,Te", ["bi", "te"]),
+        ("bi te", ["bi", "te"]),
+        ("BiTe", ["bi", "te"]),
+        ("GeSbTe", ["ge", "sb", "te"]),
+        ("TE", ["te"]),  # T and E are not elements, so Te is the only reading
+        ("gete", ["ge", "te"]),
+        ("B,I", ["b", "i"]),
+    ],
+)
+def test_parse_elements(symbols, expected):
+    assert parse_elements(symbols) == expected
+
+
+@pytest.mark.parametrize("symbols", ["BI", "bite", "Xx", "Bite", ""])
+def test_parse_elements_rejects_unknown_or_ambiguous(symbols):
+    with pytest.raises(HTTPException) as error:
+        parse_elements(symbols)
+    assert error.value.status_code == 422
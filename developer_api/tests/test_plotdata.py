@@ -0,0 +1,93 @@
+import json
+
+import numpy as np
+import pytest
+
+from plotdata import DATASET_ARRAYS, slice_plotinfo
+from routers.v2_api import BandDOS, fast_json_bytes
+
+# arrays stored as float8 and, with --storage both, as "<name> f32" bytea too
+ARRAYS = [
+    "bands",
+    "band distances",
+    "bands soc",
+    "band distances soc",
+    "density of states energies",
+    "total density of states",
+]
+PDOS_LABELS = ["Ge_s", "Ge_p", "Te_p"]
+
+
+def arrays() -> dict:
+    rng = np.random.default_rng(0)
+    return {
+        "bands": rng.normal(size=(2, 12, 30)),
+        "band distances": rng.random((2, 30)),
+        "bands soc": rng.normal(size=(2, 24, 30)),
+        "band distances soc": rng.random((2, 30)),
+        "density of states energies": np.linspace(-5, 5, 200),
+        "total density of states": rng.random(200),
+        "projected density of states": rng.random((len(PDOS_LABELS), 200)),
+    }
+
+
+def common() -> dict:
+    return {"KPoints": {"label": ["G", "M", "K"], "distance": [0.0, 0.5, 1.0]}, "fermi energy": 1.25}
+
+
+def default_row() -> dict:
+    """A dos_bands row as the default path reads it (SELECT *, float8 columns as lists)."""
+    values = arrays()
+    row = {**common(), **{name: values[name].tolist() for name in ARRAYS}}
+    row["projected density of states"] = [
+        [label, pdos.tolist()] for label, pdos in zip(PDOS_LABELS, values["projected density of states"])
+    ]
+    return row
+
+
+def fast_row() -> dict:
+    """The same material stored with --storage both, as plot_columns reads it: float32 only."""
+    values = arrays()
+    row = {**common(), "projected density of states labels": PDOS_LABELS, "f32 shapes": {}}
+    for name, value in values.items():
+        row[f"{name} f32"] = value.astype("<f4").tobytes()
+        row["f32 shapes"][name] = list(value.shape)
+        row[name] = None
+    return row
+
+
+def assert_close(fast, default):
+    if isinstance(default, dict):
+        assert set(fast) <= set(default)
+        for key in fast:
+            assert_close(fast[key], default[key])
+    elif isinstance(default, list) and default and isinstance(default[0], str):
+        assert fast == default
+    elif isinstance(default, list) and default and isinstance(default[0], list) and isinstance(default[0][0], str):
+        assert [label for label, _ in fast] == [label for label, _ in default]
+        assert np.allclose([v for _, v in fast], [v for _, v in default], rtol=1e-6, atol=1e-7)
+    elif isinstance(default, list):
+        assert np.allclose(fast, default, rtol=1e-6, atol=1e-7)
+    else:
+        assert fast == default
+
+
+def test_fast_output_matches_default_and_is_not_larger():
+    default = BandDOS.model_validate(default_row()).model_dump_json(by_alias=True).encode()
+    fast = fast_json_bytes(slice_plotinfo(fast_row(), list(DATASET_ARRAYS)))
+
+    assert_close(json.loads(fast), json.loads(default))
+    assert len(fast) <= len(default)
+
+
+@pytest.mark.parametrize("emin, emax", [(-1.0, 1.0), (-0.2, 0.3)])
+def test_windowed_bands_are_serialized_as_float32(emin, emax):
+    sliced = slice_plotinfo(fast_row(), ["bands"], emin, emax)
+    assert sliced["bands"].flags["C_CONTIGUOUS"]
+
+    stored = arrays()["bands"].astype("<f4")
+    in_window = (stored.max(axis=(0, 2)) >= emin) & (stored.min(axis=(0, 2)) <= emax)
+    body = fast_json_bytes(sliced)
+    assert np.array_equal(np.asarray(json.loads(body)["bands"], dtype="<f4"), stored[:, in_window])
+    # orjson writes float32 at float32 precision; the tolist() fallback would print float64 digits
+    assert len(body) < len(json.dumps({"bands": stored[:, in_window].tolist()}))
@@ -0,0 +1,180 @@
+# Per-request latency breakdown: pool checkout, SQL execution, row conversion
+# and serialization. The pool, cursor and route classes below add to the
+# RequestTiming of the request being served (a context variable set by the
+# middleware in main.py), so handlers need no timing code of their own.
+# Requests slower than slow_request_threshold are logged as one JSON record,
+# and X-Debug-Timing: 1 returns the breakdown in a Server-Timing header.
+
+import functools
+import inspect
+import json
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from fastapi.routing import APIRoute
+from psycopg import AsyncCursor, AsyncServerCursor
+from psycopg_pool import AsyncConnectionPool
+
+logger = logging.getLogger("timing")
+
+PHASES = ["checkout", "sql", "rows", "serialize"]
+
+# statements kept per request for the slow request log
+MAX_LOGGED_QUERIES = 20
+
+
+class RequestTiming:
+    def __init__(self) -> None:
+        self.start = time.perf_counter()
+        self.phases: Dict[str, float] = dict.fromkeys(PHASES, 0.0)
+        self.queries: List[Tuple[Any, Any, float]] = []  # (query, params, seconds), formatted only if logged
+        self.handler_end: Optional[float] = None
+        # set to a list to keep each statement with its parameters, for EXPLAIN (profiling.py)
+        self.statements: Optional[List[Tuple[Any, Any]]] = None
+
+    def add(self, phase: str, seconds: float) -> None:
+        self.phases[phase] += seconds
+
+    def add_query(self, query: Any, params: Any, seconds: float) -> None:
+        if len(self.queries) < MAX_LOGGED_QUERIES:
+            self.queries.append((query, params, seconds))
+
+    def logged_queries(self) -> List[Dict[str, Any]]:
+        return [
+            {
+                "sql": " ".join((query if isinstance(query, str) else query.as_string()).split()),
+                "params": params_shape(params),
+                "ms": round(seconds * 1e3, 3),
+            }
+            for query, params, seconds in self.queries
+        ]
+
+    def finish(self) -> Dict[str, float]:
+        """Milliseconds per phase plus total and app (whatever the phases do not cover)."""
+        end = time.perf_counter()
+        if self.handler_end is not None:
+            # FastAPI validates and serializes the return value after the handler returns
+            self.phases["serialize"] += end - self.handler_end
+        total = end - self.start
+        breakdown = {phase: seconds * 1e3 for phase, seconds in self.phases.items()}
+        breakdown["app"] = max(total * 1e3 - sum(breakdown.values()), 0.0)
+        breakdown["total"] = total * 1e3
+        return breakdown
+
+
+current_timing: ContextVar[Optional[RequestTiming]] = ContextVar("current_timing", default=None)
+
+
+def value_shape(value: Any) -> str:
+    if isinstance(value, (list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+def params_shape(params: Any) -> Any:
+    """Types (and lengths of sequences) of query parameters, never their values."""
+    if params is None:
+        return None
+    if isinstance(params, Mapping):
+        return {key: value_shape(value) for key, value in params.items()}
+    return [value_shape(value) for value in params]
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(phase, time.perf_counter() - start)
+
+
+class TimedCursorMixin:
+    async def execute(self, query, params=None, **kwargs):
+        timing = current_timing.get()
+        if timing is None:
+            return await super().execute(query, params, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            timing.add("sql", elapsed)
+            timing.add_query(query, params, elapsed)
+            if timing.statements is not None:
+                timing.statements.append((query, params))
+
+    # the results are already on the client, so fetching is mostly loading rows into Python
+    async def fetchone(self):
+        with timed("rows"):
+            return await super().fetchone()
+
+    async def fetchmany(self, size: int = 0):
+        with timed("rows"):
+            return await super().fetchmany(size)
+
+    async def fetchall(self):
+        with timed("rows"):
+            return await super().fetchall()
+
+
+class TimedCursor(TimedCursorMixin, AsyncCursor):
+    pass
+
+
+class TimedServerCursor(TimedCursorMixin, AsyncServerCursor):
+    # fetches from a named cursor are round trips, so "rows" includes their SQL time
+    pass
+
+
+async def configure_connection(conn) -> None:
+    conn.cursor_factory = TimedCursor
+    conn.server_cursor_factory = TimedServerCursor
+
+
+class TimedConnectionPool(AsyncConnectionPool):
+    async def getconn(self, timeout: Optional[float] = None):
+        with timed("checkout"):
+            return await super().getconn(timeout=timeout)
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that marks when the handler returns, to tell its time from FastAPI's serialization."""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any) -> None:
+        if not inspect.iscoroutinefunction(endpoint):
+            super().__init__(path, endpoint, **kwargs)
+            return
+
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                timing = current_timing.get()
+                if timing is not None:
+                    timing.handler_end = time.perf_counter()
+
+        super().__init__(path, timed_endpoint, **kwargs)
+
+
+def server_timing(breakdown: Dict[str, float]) -> str:
+    return ", ".join(f"{name};dur={ms:.2f}" for name, ms in breakdown.items())
+
+
+def log_slow_request(method: str, route: str, status: int, timing: RequestTiming, breakdown: Dict[str, float]) -> None:
+    logger.warning(json.dumps({
+        "event": "slow_request",
+        "method": method,
+        "route": route,
+        "status": status,
+        "ms": {name: round(ms, 3) for name, ms in breakdown.items()},
+        "queries": timing.logged_queries(),
+    }))
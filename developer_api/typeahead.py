@@ -0,0 +1,92 @@
+# In-process prefix index over formula, MP-ID and spacegroup for autocomplete.
+# Suggestions are answered from a sorted key list with bisect, without touching
+# the connection pool; the index is rebuilt when the data table changes.
+
+import re
+from bisect import bisect_left
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from psycopg_pool import AsyncConnectionPool
+
+TYPEAHEAD_FIELDS = ["formula", "MP-ID", "spacegroup"]
+
+
+class Suggestion(NamedTuple):
+    value: str
+    field: str
+    ids: Tuple[int, ...]
+
+
+def normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def index_keys(field: str, value: str) -> List[str]:
+    """Normalized keys a value can be found by: the whole value, plus the bare number of an MP-ID or spacegroup."""
+    keys = [normalize(value)]
+    if field == "MP-ID":
+        keys.append(normalize(value.split("-", 1)[-1]))  # "mp-2822" -> "2822"
+    elif field == "spacegroup":
+        number = re.search(r"\((\d+)\)", value)  # "R-3m (166)" -> "166"
+        if number:
+            keys.append(number.group(1))
+    return keys
+
+
+class TypeaheadIndex:
+    def __init__(self) -> None:
+        self.keys: List[str] = []
+        self.suggestions: List[Suggestion] = []
+        self.version: Optional[Tuple[Any, ...]] = None
+
+    def build(self, rows: List[Tuple[int, Optional[str], Optional[str], Optional[str]]]) -> None:
+        """Rebuild from (id, formula, MP-ID, spacegroup) rows; suggestions with the same value share one entry."""
+        grouped: Dict[Tuple[str, str], List[int]] = {}
+        for id, *values in rows:
+            for field, value in zip(TYPEAHEAD_FIELDS, values):
+                if value:
+                    grouped.setdefault((field, value), []).append(id)
+        entries = sorted(
+            (key, Suggestion(value, field, tuple(sorted(ids))))
+            for (field, value), ids in grouped.items()
+            for key in dict.fromkeys(index_keys(field, value))
+        )
+        # swap both lists at once so concurrent readers never see a half-built index
+        self.keys, self.suggestions = [key for key, _ in entries], [s for _, s in entries]
+
+    def suggest(self, prefix: str, limit: int = 10) -> List[Suggestion]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        keys, suggestions = self.keys, self.suggestions
+        found: Dict[Tuple[str, str], Suggestion] = {}
+        i = bisect_left(keys, prefix)
+        while i < len(keys) and keys[i].startswith(prefix) and len(found) < limit:
+            suggestion = suggestions[i]
+            found.setdefault((suggestion.field, suggestion.value), suggestion)
+            i += 1
+        return list(found.values())
+
+    async def refresh(self, pool: AsyncConnectionPool) -> bool:
+        """
+        Rebuild if data was written to since the last build, going by its write
+        counters in pg_stat_user_tables (these lag commits by up to ~10 s).
+        Returns whether it rebuilt.
+        """
+        async with pool.connection() as conn:
+            cur = await conn.execute(
+                """
+                SELECT n_tup_ins, n_tup_upd, n_tup_del
+                FROM pg_stat_user_tables WHERE relname = 'data';
+                """
+            )
+            version = await cur.fetchone()
+            if version is not None and version == self.version:
+                return False
+            cur = await conn.execute('SELECT id, formula, "MP-ID", spacegroup FROM data;')
+            rows = await cur.fetchall()
+        self.build(rows)
+        self.version = version
+        return True
+
+
+typeahead_index = TypeaheadIndex()